@@ -1,99 +1,217 @@
+import asyncio, json, os, shutil, tempfile, time
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, UploadFile, File, Form, Depends, HTTPException
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+from auto.utils import ensure_dir, detect_device, upload_name, zip_stream
+from auto.runner import Pipeline, warmup
+from auto.post import AUDIO_FORMATS
+from auto.crossover import DRUM_CROSSOVERS, parse_crossovers
+from auto.gate import GATE_ACTIVITY, GATE_DB
+from auto.jobs import JobStore, JobQueue, QueueFull
+from auto.cache import StemCache
+from auto.metrics import aggregate, peak_rss_mb
 
-import os, tempfile
-from fastapi import FastAPI, UploadFile, File, Form
-from fastapi.responses import FileResponse, JSONResponse
-from auto.utils import ensure_dir, basename_noext, detect_device, zip_dir, band_split
-from auto.engine import run_demucs, find_output_folder
-from auto.nmf_split import split_file_nmf
-from auto.classify import tag_wav, best_label
-from auto.post import trim_silence, loudness_normalize, save_wav, export_mp3
-from auto.report import build_report
-import soundfile as sf, glob, numpy as np
+OUT = "outputs"
+WORKERS = int(os.environ.get("DESMIX_WORKERS", "1"))
+QUEUE_SIZE = int(os.environ.get("DESMIX_QUEUE", "8"))
+CACHE_DIR = os.environ.get("DESMIX_CACHE_DIR", "cache")
+CACHE_GB = float(os.environ.get("DESMIX_CACHE_GB", "20"))
+WARMUP = [m for m in os.environ.get("DESMIX_WARMUP", "").split(",") if m]
+DEMUCS_JOBS = int(os.environ.get("DESMIX_DEMUCS_JOBS", "1"))
+UPLOAD_CHUNK = 1 << 20
+MEDIA_TYPES = {".mp3": "audio/mpeg", ".flac": "audio/flac", ".opus": "audio/ogg", ".wav": "audio/wav"}
 
-app = FastAPI(title="Desmixador API", version="1.0.0")
+# criados no startup (_lifespan): importar o módulo não toca o disco nem sobe threads
+jobs: JobQueue = None
+cache: StemCache = None
 
-@app.post("/separate")
-async def separate(file: UploadFile = File(...),
-                   base_model: str = Form("htdemucs"),
-                   mp3: bool = Form(True),
-                   bitrate: int = Form(320),
-                   gpu: bool = Form(False),
-                   shifts: int = Form(0),
-                   overlap: float = Form(0.25),
-                   normalize: bool = Form(True),
-                   trim: bool = Form(True),
-                   sr: int | None = Form(None),
-                   max_extra: int = Form(6),
-                   drum_split: bool = Form(False)):
-    ensure_dir("outputs"); ensure_dir("reports")
-    with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(file.filename)[1]) as tmp:
-        tmp.write(await file.read())
+@asynccontextmanager
+async def _lifespan(app):
+    """Abre o cache e a fila de jobs (com os workers) e, com DESMIX_WARMUP (modelos
+    separados por vírgula), carrega tudo antes de aceitar jobs."""
+    global jobs, cache
+    ensure_dir(OUT)
+    cache = StemCache(CACHE_DIR, int(CACHE_GB * 2**30))
+    jobs = JobQueue(JobStore(os.path.join(OUT, "jobs.sqlite")), _run_job, workers=WORKERS, maxsize=QUEUE_SIZE)
+    if WARMUP:
+        warmup(WARMUP, device=detect_device(False), demucs_jobs=DEMUCS_JOBS)
+    yield
+
+app = FastAPI(title="Desmixador API", version="1.0.0", lifespan=_lifespan)
+
+def _job_dir(job_id):
+    return os.path.join(OUT, "jobs", job_id)
+
+def _run_job(job, progress):
+    p = job["params"]
+    job_dir = ensure_dir(_job_dir(job["id"]))
+    pipeline = Pipeline(out_dir=job_dir, device=detect_device(p["gpu"]), model=p["base_model"],
+                        shifts=p["shifts"], overlap=p["overlap"], drum_split=p["drum_split"],
+                        drum_crossovers=p.get("drum_crossovers") or DRUM_CROSSOVERS,
+                        gate=p.get("gate", True), gate_db=p.get("gate_db", GATE_DB),
+                        gate_activity=p.get("gate_activity", GATE_ACTIVITY), demucs_jobs=DEMUCS_JOBS,
+                        max_extra=p["max_extra"], sr_target=p["sr"], trim=p["trim"], normalize=p["normalize"],
+                        mp3=p["mp3"], fmt=p.get("format"), bitrate=p["bitrate"], reports_dir=job_dir, zip=False, cache=cache)
+    run = pipeline.run(job["input"], song=job["song"], progress=progress,
+                       on_stem=lambda s: jobs.store.add_stem(job["id"], s.meta()))
+    jobs.store.update(job["id"], metrics=json.dumps(run.metrics.to_dict()))
+    return run.folder
+
+def _params(base_model: str = Form("htdemucs"),
+            mp3: bool = Form(True),
+            fmt: str | None = Form(None, alias="format"),
+            bitrate: int = Form(320),
+            gpu: bool = Form(False),
+            shifts: int = Form(0),
+            overlap: float = Form(0.25),
+            normalize: bool = Form(True),
+            trim: bool = Form(True),
+            sr: int | None = Form(None),
+            max_extra: int = Form(6),
+            drum_split: bool = Form(False),
+            drum_crossovers: str = Form("160,6000"),
+            gate: bool = Form(True),
+            gate_db: float = Form(GATE_DB),
+            gate_activity: float = Form(GATE_ACTIVITY)) -> dict:
+    if fmt and fmt not in AUDIO_FORMATS:
+        raise HTTPException(422, f"format deve ser um de: {', '.join(AUDIO_FORMATS)}")
+    try:
+        crossovers = list(parse_crossovers(drum_crossovers))
+    except ValueError as e:
+        raise HTTPException(422, f"drum_crossovers: {e}")
+    return dict(base_model=base_model, mp3=mp3, format=fmt, bitrate=bitrate, gpu=gpu, shifts=shifts, overlap=overlap,
+                normalize=normalize, trim=trim, sr=sr, max_extra=max_extra, drum_split=drum_split,
+                drum_crossovers=crossovers, gate=gate, gate_db=gate_db, gate_activity=gate_activity)
+
+def _status(job):
+    out = {k: job[k] for k in ("id", "song", "status", "stage", "progress", "error")}
+    out["stems"] = [m["name"] for m in job["stems"]]
+    return out
+
+def _get(job_id):
+    job = jobs.store.get(job_id)
+    if job is None:
+        raise HTTPException(404, "job não encontrado")
+    return job
+
+async def _submit(file: UploadFile, params: dict) -> str:
+    """Grava o upload em disco em pedaços (sem carregar o arquivo inteiro na memória) e enfileira."""
+    song, ext = upload_name(file.filename)
+    with tempfile.NamedTemporaryFile(delete=False, suffix=ext) as tmp:
+        while chunk := await file.read(UPLOAD_CHUNK):
+            tmp.write(chunk)
         tmp_path = tmp.name
-    song = os.path.splitext(file.filename)[0]
     try:
-        device = detect_device(gpu)
-        run_demucs(tmp_path, out_dir="outputs", device=device, model=base_model, shifts=shifts, overlap=overlap, mp3=False)
-        folder = find_output_folder("outputs", base_model, song)
-
-        stems_meta = []
-        def _finalize(name, y, sr0):
-            if trim: y = trim_silence(y, sr0)
-            if normalize: y = loudness_normalize(y, sr0, -14.0)
-            dest = os.path.join(folder, f"{name}.wav")
-            save_wav(dest, y, sr0)
-            try:
-                scores = tag_wav(dest); label = best_label(scores); conf = max(scores.values())
-            except Exception:
-                label = "desconhecido"; conf = 0.0
-            final = dest
-            if mp3:
-                final = export_mp3(dest, bitrate=bitrate)
-                try: os.remove(dest)
-                except: pass
-            stems_meta.append({"name": name, "path": final, "label": label, "confidence": conf})
-
-        def _load(path):
-            try:
-                y, sr0 = sf.read(path, always_2d=False)
-                if hasattr(y, "ndim") and y.ndim > 1: y = y.mean(axis=1)
-                return y, sr0
-            except Exception:
-                return None, None
-
-        base_stems = {}
-        for name in ["vocals","drums","bass","other","piano","guitar"]:
-            cand = glob.glob(os.path.join(folder, f"{name}.*"))
-            if cand:
-                y, sr0 = _load(cand[0])
-                if y is not None: base_stems[name] = (y, sr0)
-
-        for n in ["vocals","bass"]:
-            if n in base_stems:
-                _finalize(n, base_stems[n][0], base_stems[n][1])
-
-        if "drums" in base_stems and drum_split:
-            y, sr0 = base_stems["drums"]
-            low, mid, high = band_split(y, sr0)
-            _finalize("drums_low", low, sr0)
-            _finalize("drums_mid", mid, sr0)
-            _finalize("drums_high", high, sr0)
-        elif "drums" in base_stems:
-            _finalize("drums", base_stems["drums"][0], base_stems["drums"][1])
-
-        for n in ["piano","guitar","other"]:
-            if n in base_stems and os.path.exists(os.path.join(folder, f"{n}.wav")):
-                comps, sr1, k, errs = split_file_nmf(os.path.join(folder, f"{n}.wav"), max_k=max_extra, sr_target=sr)
-                for i, yi in enumerate(comps, start=1):
-                    _finalize(f"{n}_comp{i}", yi, sr1)
-
-        html = os.path.join("reports", f"{song}.html")
-        build_report(folder, stems_meta, html, song)
-
-        zip_path = os.path.join("outputs", f"{song}-autostems.zip")
-        zip_dir(folder, zip_path)
-        return FileResponse(zip_path, media_type="application/zip", filename=os.path.basename(zip_path))
-    except Exception as e:
-        return JSONResponse({"error": str(e)}, status_code=500)
-    finally:
-        try: os.remove(tmp_path)
-        except: pass
+        return jobs.submit(song, tmp_path, params)
+    except QueueFull:
+        os.remove(tmp_path)
+        raise HTTPException(503, "fila cheia, tente novamente", headers={"Retry-After": "30"})
+
+def _live_entries(job_id, poll=0.5):
+    """(caminho, nome no zip) de cada stem assim que é finalizado, até o job terminar."""
+    sent = 0
+    while True:
+        job = jobs.store.get(job_id)
+        for m in job["stems"][sent:]:
+            yield m["path"], f"{job['song']}/{os.path.basename(m['path'])}"
+        sent = len(job["stems"])
+        if job["status"] not in ("queued", "running"):
+            if job["status"] != "done" and os.path.isdir(_job_dir(job_id)):
+                err = os.path.join(_job_dir(job_id), "erro.txt")
+                with open(err, "w", encoding="utf-8") as f:
+                    f.write(job["error"] or job["status"])
+                yield err, f"{job['song']}/erro.txt"
+            return
+        time.sleep(poll)
+
+def _zip_response(job, cleanup=False):
+    def _body():
+        try:
+            yield from zip_stream(_live_entries(job["id"]))
+        finally:
+            if cleanup:
+                shutil.rmtree(_job_dir(job["id"]), ignore_errors=True)
+    return StreamingResponse(_body(), media_type="application/zip",
+                             headers={"Content-Disposition": f'attachment; filename="{job["song"]}-autostems.zip"'})
+
+@app.post("/jobs", status_code=202)
+async def submit_job(file: UploadFile = File(...), params: dict = Depends(_params)):
+    return _status(jobs.store.get(await _submit(file, params)))
+
+@app.get("/jobs/{job_id}")
+def job_status(job_id: str):
+    return _status(_get(job_id))
+
+@app.get("/jobs/{job_id}/result")
+def job_result(job_id: str):
+    """ZIP em streaming: começa a enviar os stems já prontos e segue até o job terminar."""
+    job = _get(job_id)
+    if job["status"] in ("failed", "cancelled", "deleted"):
+        raise HTTPException(409, f"job {job['status']}")
+    return _zip_response(job)
+
+@app.get("/jobs/{job_id}/stems")
+def job_stems(job_id: str):
+    return _get(job_id)["stems"]
+
+@app.get("/jobs/{job_id}/stems/{name}")
+def job_stem(job_id: str, name: str):
+    for m in _get(job_id)["stems"]:
+        if m["name"] == name and os.path.exists(m["path"]):
+            media = MEDIA_TYPES.get(os.path.splitext(m["path"])[1], "application/octet-stream")
+            return FileResponse(m["path"], media_type=media, filename=os.path.basename(m["path"]))
+    raise HTTPException(404, "stem não encontrado (ou ainda não finalizado)")
+
+@app.get("/jobs/{job_id}/report")
+def job_report(job_id: str):
+    job = _get(job_id)
+    html = os.path.join(_job_dir(job_id), f"{job['song']}.html")
+    if job["status"] != "done" or not os.path.exists(html):
+        raise HTTPException(404, "relatório indisponível")
+    return FileResponse(html, media_type="text/html")
+
+@app.delete("/jobs/{job_id}")
+def cancel_job(job_id: str):
+    """Cancela um job na fila/em execução; num job encerrado, apaga os arquivos dele."""
+    job = _get(job_id)
+    if job["status"] in ("queued", "running"):
+        return _status(jobs.cancel(job_id))
+    shutil.rmtree(_job_dir(job_id), ignore_errors=True)
+    jobs.store.update(job_id, status="deleted")
+    return _status(jobs.store.get(job_id))
+
+@app.get("/jobs/{job_id}/metrics")
+def job_metrics(job_id: str):
+    """Tempo de parede, CPU e pico de RSS por estágio do job (disponível ao concluir)."""
+    job = _get(job_id)
+    if job["metrics"] is None:
+        raise HTTPException(404, "métricas indisponíveis")
+    return job["metrics"]
+
+@app.get("/metrics")
+def metrics(last: int = 100):
+    """Agregado por estágio dos últimos `last` jobs concluídos + estado do processo."""
+    runs = jobs.store.all_metrics(last)
+    return {"jobs": len(runs), "stages": aggregate(runs), "peak_rss_mb": peak_rss_mb(),
+            "queued": jobs.q.qsize()}
+
+@app.get("/cache/stats")
+def cache_stats():
+    return cache.stats()
+
+@app.post("/separate")
+async def separate(file: UploadFile = File(...), params: dict = Depends(_params)):
+    """Compatibilidade: enfileira o job e devolve o ZIP em streaming; os arquivos são apagados ao final.
+
+    A resposta só começa quando sai o primeiro stem (ou o job termina): se o job falhar
+    antes disso, responde 500 com {"error": ...}, como antes da fila.
+    """
+    job_id = await _submit(file, params)
+    job = jobs.store.get(job_id)
+    while job["status"] in ("queued", "running") and not job["stems"]:
+        await asyncio.sleep(0.5)
+        job = jobs.store.get(job_id)
+    if job["status"] in ("failed", "cancelled"):
+        shutil.rmtree(_job_dir(job_id), ignore_errors=True)
+        return JSONResponse({"error": job["error"] or f"job {job['status']}"}, status_code=500)
+    return _zip_response(job, cleanup=True)
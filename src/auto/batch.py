@@ -0,0 +1,54 @@
+import queue, threading
+from typing import Callable, Iterable, List, Tuple
+
+_DONE = object()
+
+def run_stages(inputs: Iterable, stages: List[Tuple[str, Callable, int]], queue_size: int = 2):
+    """Executa cada entrada por uma cadeia de estágios (nome, fn, workers) em threads.
+
+    Cada estágio tem sua própria concorrência; as filas entre estágios são limitadas a
+    `queue_size` itens, então um estágio rápido bloqueia (back-pressure) em vez de acumular
+    músicas em memória. Gera (entrada, resultado, erro) na ordem de conclusão, onde erro é
+    None ou (nome do estágio, exceção); uma falha pula os estágios seguintes daquela entrada.
+    """
+    qs = [queue.Queue(maxsize=max(1, queue_size)) for _ in stages] + [queue.Queue()]
+    n_workers = [max(1, w) for _, _, w in stages] + [1]
+
+    def _feed():
+        for x in inputs:
+            qs[0].put((x, x, None))
+        for _ in range(n_workers[0]):
+            qs[0].put(_DONE)
+
+    def _work(i, remaining, lock):
+        name, fn, _ = stages[i]
+        while True:
+            job = qs[i].get()
+            if job is _DONE:
+                with lock:
+                    remaining[0] -= 1
+                    last = remaining[0] == 0
+                if last:
+                    for _ in range(n_workers[i + 1]):
+                        qs[i + 1].put(_DONE)
+                return
+            src, val, err = job
+            if err is None:
+                try:
+                    val = fn(val)
+                except Exception as e:
+                    val, err = None, (name, e)
+            qs[i + 1].put((src, val, err))
+
+    threads = [threading.Thread(target=_feed, daemon=True)]
+    for i in range(len(stages)):
+        remaining, lock = [n_workers[i]], threading.Lock()
+        threads += [threading.Thread(target=_work, args=(i, remaining, lock), daemon=True)
+                    for _ in range(n_workers[i])]
+    for t in threads:
+        t.start()
+    while True:
+        job = qs[-1].get()
+        if job is _DONE:
+            break
+        yield job
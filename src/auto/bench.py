@@ -0,0 +1,176 @@
+import time
+import numpy as np
+
+def synthetic_mix(sr=22050, seconds=30.0, seed=0):
+    """Mistura sintética com fontes conhecidas: baixo, acorde com envelope e ruído percussivo."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(sr * seconds)) / sr
+    bass = 0.6 * np.sin(2 * np.pi * 55 * t) * (np.sin(2 * np.pi * 0.5 * t) > 0)
+    chord = sum(0.25 * np.sin(2 * np.pi * f * t) for f in (440, 554.4, 659.3))
+    chord = chord * (np.sin(2 * np.pi * 0.3 * t + 1) > 0)
+    hits = np.zeros_like(t)
+    hits[::sr // 4] = 1.0
+    perc = np.convolve(hits, np.exp(-np.arange(sr // 20) / (sr / 400)), mode="same")
+    perc = 0.4 * perc * rng.standard_normal(len(t))
+    refs = [x.astype(np.float32) for x in (bass, chord, perc)]
+    return np.sum(refs, axis=0), refs
+
+def sdr(ref, est):
+    n = min(len(ref), len(est))
+    ref, est = ref[:n], est[:n]
+    return float(10 * np.log10(np.sum(ref**2) / (np.sum((ref - est) ** 2) + 1e-12) + 1e-12))
+
+def _best_sdr(refs, comps):
+    """SDR médio, casando cada fonte de referência com o componente que melhor a reconstrói."""
+    return float(np.mean([max(sdr(r, c) for c in comps) for r in refs]))
+
+def bench_nmf_resolution(seconds=30.0, sr=22050, max_k=6, resolutions=None):
+    """Tempo e SDR do split_nmf em cada resolução de fatoração."""
+    from auto.nmf_split import split_nmf, NMF_RESOLUTIONS
+    mix, refs = synthetic_mix(sr, seconds)
+    rows = []
+    for res in resolutions or list(NMF_RESOLUTIONS):
+        t0 = time.perf_counter()
+        comps, _, k, _ = split_nmf(mix, sr, max_k=max_k, resolution=res)
+        rows.append({"resolution": res, "seconds": time.perf_counter() - t0, "k": k,
+                     "sdr_db": _best_sdr(refs, comps)})
+    return rows
+
+def bench_nmf_backends(seconds=30.0, sr=22050, max_k=6, configs=None):
+    """Tempo, K e SDR do split_nmf por backend/divergência (sklearn é a referência)."""
+    from auto.nmf_split import split_nmf
+    mix, refs = synthetic_mix(sr, seconds)
+    configs = configs or [{"backend": "sklearn"}, {"backend": "mu"}, {"backend": "mu", "shared_init": True},
+                          {"backend": "mu", "beta": "kl", "shared_init": True}]
+    rows = []
+    for cfg in configs:
+        t0 = time.perf_counter()
+        comps, _, k, _ = split_nmf(mix, sr, max_k=max_k, **cfg)
+        rows.append({**cfg, "seconds": time.perf_counter() - t0, "k": k, "sdr_db": _best_sdr(refs, comps)})
+    return rows
+
+def _components_loop(W, H, M, P):
+    """Reconstrução de referência (um componente por vez, máscara + fase + istft separados)."""
+    import librosa
+    comps = []
+    recon = W @ H + 1e-9
+    for i in range(W.shape[1]):
+        mask = (W[:, [i]] @ H[[i], :]) / recon
+        comps.append(librosa.istft(mask * M * np.exp(1j * P), hop_length=512).astype(np.float32))
+    return comps
+
+def bench_masks(seconds=60.0, sr=22050, k=12, repeat=3):
+    """Micro-benchmark da reconstrução das máscaras NMF: loop por componente vs. em lote.
+
+    Tempo (melhor de `repeat`) e pico de memória alocada pelo NumPy (tracemalloc, MB) de cada um.
+    """
+    import tracemalloc
+    import librosa
+    from auto.nmf_split import _components
+    mix, _ = synthetic_mix(sr, seconds)
+    S = librosa.stft(mix.astype(np.float32), n_fft=2048, hop_length=512)
+    M, P = np.abs(S), np.angle(S)
+    rng = np.random.default_rng(0)
+    W = rng.random((S.shape[0], k)).astype(np.float32)
+    H = rng.random((k, S.shape[1])).astype(np.float32)
+    def best(fn):
+        times = []
+        for _ in range(repeat):
+            t0 = time.perf_counter(); out = fn(); times.append(time.perf_counter() - t0)
+        tracemalloc.start()
+        fn()
+        peak = tracemalloc.get_traced_memory()[1] / 2**20
+        tracemalloc.stop()
+        return min(times), peak, out
+    t_loop, mb_loop, ref = best(lambda: _components_loop(W, H, M, P))
+    t_vec, mb_vec, out = best(lambda: _components(W, H, S, length=len(ref[0])))
+    err = max(float(np.max(np.abs(a - b))) for a, b in zip(ref, out))
+    return {"k": k, "seconds": seconds, "loop_s": t_loop, "batched_s": t_vec,
+            "loop_peak_mb": mb_loop, "batched_peak_mb": mb_vec, "max_abs_diff": err}
+
+def synthetic_stems(sr=44100, seconds=30.0, seed=0):
+    """Stems base sintéticos (estéreo) no formato do separate_base: substituem o Demucs no benchmark."""
+    rng = np.random.default_rng(seed)
+    mix, (bass, chord, perc) = synthetic_mix(sr, seconds, seed)
+    t = np.arange(len(mix)) / sr
+    vocals = 0.3 * np.sin(2 * np.pi * 220 * t + 3 * np.sin(2 * np.pi * 5 * t)) * (np.sin(2 * np.pi * 0.2 * t) > -0.3)
+    other = chord + 0.02 * rng.standard_normal(len(t))
+    def pan(x, p):
+        return np.stack([x * (1 - p), x * p]).astype(np.float32)
+    return {"vocals": (pan(vocals, 0.5), sr), "drums": (pan(perc, 0.45), sr),
+            "bass": (pan(bass, 0.5), sr), "other": (pan(other, 0.6), sr)}
+
+def bench_pipeline(out_dir="bench", songs=2, seconds=30.0, sr=44100, inputs=None, fmt="mp3",
+                   max_extra=6, drum_split=True, nmf_opts=None, report=True, device="cpu"):
+    """Pipeline completo por música (Demucs → NMF → pós → relatório → ZIP) com métricas por estágio.
+
+    Sem `inputs`, cada "música" são stems sintéticos (seed = índice) e o Demucs fica de fora;
+    com `inputs` (arquivos de áudio) roda o Demucs de verdade. Sem cache, para medir tudo.
+    Retorna um dict serializável (ambiente, parâmetros, métricas por música e agregadas).
+    """
+    import os, platform
+    from auto.metrics import aggregate
+    from auto.runner import Pipeline
+    pipeline = Pipeline(out_dir=out_dir, device=device, drum_split=drum_split, max_extra=max_extra,
+                        nmf_opts=nmf_opts, fmt=fmt, report=report, reports_dir=out_dir)
+    runs = []
+    sources = inputs or [None] * songs
+    for i, src in enumerate(sources):
+        if src:
+            run = pipeline.run(src)
+        else:
+            run = pipeline.run(None, song=f"synthetic{i}", base_stems=synthetic_stems(sr, seconds, seed=i))
+        runs.append(run.metrics.to_dict())
+    return {"created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "env": {"python": platform.python_version(), "platform": platform.platform(),
+                    "numpy": np.__version__, "cpus": os.cpu_count()},
+            "params": {"songs": len(sources), "seconds": None if inputs else seconds, "sr": sr,
+                       "synthetic": not inputs, "format": fmt, "max_extra": max_extra,
+                       "drum_split": drum_split, "nmf_opts": nmf_opts or {}},
+            "songs": runs, "stages": aggregate(runs)}
+
+def bench_demucs_jobs(input_path, model="htdemucs", jobs=(1, 4), shifts=1, overlap=0.25, seed=0):
+    """Tempo do Demucs em CPU com 1 job e com N processos de segmentos, e a diferença máxima
+    de cada resultado para o de 1 job (os shifts são sorteados com a mesma semente)."""
+    import random
+    from auto.engine import get_engine, warm_segment_pool
+    engine = get_engine(model, "cpu")
+    wav = engine.load(input_path)
+    rows, ref = [], None
+    for n in jobs:
+        if n > 1:
+            warm_segment_pool(model, n)
+        random.seed(seed)
+        t0 = time.perf_counter()
+        stems, _ = engine.separate_wav(wav, shifts=shifts, overlap=overlap, jobs=n)
+        secs = time.perf_counter() - t0
+        ref = ref or stems
+        diff = max(float(np.max(np.abs(stems[k] - ref[k]))) for k in ref)
+        rows.append({"jobs": n, "seconds": secs, "max_abs_diff": diff})
+    return rows
+
+STARTUP_CASES = {
+    "cli --help": ["{src}/autostems.py", "--help"],
+    "import api.main": ["-c", "import api.main"],
+    "import auto.runner": ["-c", "import auto.runner"],
+}
+
+def bench_startup(repeat=5, cases=None):
+    """Tempo de partida a frio (processo novo) do CLI e da API: mínimo e mediana de `repeat`.
+
+    Os casos rodam num diretório temporário, para nada do que criarem cair na árvore do código.
+    """
+    import os, subprocess, sys, tempfile
+    src = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, [src, os.environ.get("PYTHONPATH")]))}
+    rows = []
+    for name, args in (cases or STARTUP_CASES).items():
+        times = []
+        for _ in range(repeat):
+            with tempfile.TemporaryDirectory() as cwd:
+                t0 = time.perf_counter()
+                subprocess.run([sys.executable, *(a.format(src=src) for a in args)], cwd=cwd, env=env,
+                               check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+                times.append(time.perf_counter() - t0)
+        rows.append({"case": name, "min_s": min(times), "median_s": float(np.median(times))})
+    return rows
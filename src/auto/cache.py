@@ -0,0 +1,94 @@
+import hashlib, json, os, shutil, threading, uuid
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+
+CACHE_VERSION = 2
+
+def array_hash(*arrays) -> str:
+    """Hash do conteúdo decodificado (amostras float32), independente do container/arquivo."""
+    h = hashlib.blake2b(digest_size=20)
+    for a in arrays:
+        a = np.ascontiguousarray(a, dtype=np.float32)
+        h.update(str(a.shape).encode())
+        h.update(memoryview(a).cast("B"))
+    return h.hexdigest()
+
+def cache_key(*parts) -> str:
+    return hashlib.blake2b(json.dumps([CACHE_VERSION, *parts], sort_keys=True, default=str).encode(),
+                           digest_size=20).hexdigest()
+
+class StemCache:
+    """Cache endereçado por conteúdo em disco, com despejo LRU limitado por tamanho.
+
+    Cada entrada é um diretório `<root>/<namespace>/<key>/` com um .npy por array e um
+    meta.json; o mtime do meta.json marca o último acesso.
+    """
+
+    def __init__(self, root: str = "cache", max_bytes: int = 20 * 2**30):
+        self.root, self.max_bytes = root, max_bytes
+        self.hits: Dict[str, int] = {}
+        self.misses: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def _count(self, table, ns):
+        with self._lock:
+            table[ns] = table.get(ns, 0) + 1
+
+    def get(self, ns: str, key: str) -> Optional[Tuple[dict, List[np.ndarray]]]:
+        d = os.path.join(self.root, ns, key)
+        try:
+            with open(os.path.join(d, "meta.json"), encoding="utf-8") as f:
+                meta = json.load(f)
+            arrays = [np.load(os.path.join(d, f"{i}.npy")) for i in range(meta["n"])]
+            os.utime(os.path.join(d, "meta.json"))   # entrada removida por um evict() concorrente = miss
+        except (OSError, ValueError, KeyError):
+            self._count(self.misses, ns)
+            return None
+        self._count(self.hits, ns)
+        return meta["info"], arrays
+
+    def put(self, ns: str, key: str, info: dict, arrays: List[np.ndarray]):
+        final = os.path.join(self.root, ns, key)
+        tmp = os.path.join(self.root, ns, f".tmp-{uuid.uuid4().hex}")
+        os.makedirs(tmp)
+        try:
+            for i, a in enumerate(arrays):
+                np.save(os.path.join(tmp, f"{i}.npy"), np.asarray(a))
+            with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as f:
+                json.dump({"n": len(arrays), "info": info}, f)
+            os.replace(tmp, final)
+        except OSError:
+            shutil.rmtree(tmp, ignore_errors=True)
+            if not os.path.isdir(final):
+                raise
+        self.evict()
+
+    def _entries(self):
+        for ns in os.scandir(self.root):
+            if not ns.is_dir():
+                continue
+            for e in os.scandir(ns.path):
+                if e.is_dir() and not e.name.startswith(".tmp-"):
+                    files = list(os.scandir(e.path))
+                    size = sum(f.stat().st_size for f in files)
+                    try: atime = os.stat(os.path.join(e.path, "meta.json")).st_mtime
+                    except OSError: atime = 0.0
+                    yield atime, size, e.path
+
+    def evict(self):
+        """Remove as entradas menos usadas até o total caber em max_bytes."""
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+
+    def stats(self) -> dict:
+        entries = list(self._entries())
+        with self._lock:
+            hits, misses = dict(self.hits), dict(self.misses)
+        return {"hits": hits, "misses": misses, "entries": len(entries),
+                "bytes": sum(size for _, size, _ in entries), "max_bytes": self.max_bytes}
@@ -1,7 +1,12 @@
 
+import threading
 import numpy as np
-from typing import Dict
-from panns_inference import AudioTagging
+from typing import Dict, List, Sequence, Tuple
+
+# panns_inference (torch) e librosa são importados só quando a classificação roda
+
+PANNS_SR = 32000
+SEGMENT_S = 10.0
 
 INSTRUMENT_CATS = {
     "Electric guitar": "guitarra",
@@ -28,11 +33,74 @@ INSTRUMENT_CATS = {
     "Opera": "voz",
 }
 
+_TAGGERS = {}
+_TAGGERS_LOCK = threading.Lock()
+
+def get_tagger(device: str = "cpu"):
+    """CNN14 carregado uma única vez por processo (por device), sob lock para que primeiros
+    usos simultâneos não carreguem duas cópias."""
+    with _TAGGERS_LOCK:
+        if device not in _TAGGERS:
+            from panns_inference import AudioTagging
+            _TAGGERS[device] = AudioTagging(checkpoint_path=None, device=device)
+        return _TAGGERS[device]
+
+def _windows(y, sr, max_windows=6):
+    """(janelas, pesos): janelas de SEGMENT_S a 32 kHz mono e a fração real de áudio de cada uma.
+
+    Stems com mais de `max_windows` janelas (60 s com o padrão) são representados por
+    `max_windows` janelas espaçadas uniformemente ao longo do stem. A última janela é
+    completada com zeros; o peso dela é a parte com áudio, para que na média o enchimento
+    não dilua os scores. As janelas são escolhidas nas amostras originais e só elas passam
+    por downmix e resample, então um stem longo (ex.: memmap do NMF em fluxo) não é copiado
+    inteiro.
+    """
+    seg, seg_src, total = int(SEGMENT_S * PANNS_SR), int(SEGMENT_S * sr), y.shape[-1]
+    n = max(1, -(-total // seg_src))
+    picks = range(n) if n <= max_windows else np.linspace(0, n - 1, max_windows).round().astype(int)
+    frames = np.zeros((len(picks), seg), dtype=np.float32)
+    weights = np.array([max(min(seg_src, total - i * seg_src), 1) / seg_src for i in picks])
+    for j, i in enumerate(picks):
+        w = np.asarray(y[..., i * seg_src:(i + 1) * seg_src], dtype=np.float32)
+        if w.ndim > 1:
+            w = w.mean(axis=0)
+        if sr != PANNS_SR:
+            import librosa
+            w = librosa.resample(w, orig_sr=sr, target_sr=PANNS_SR)
+        frames[j, :min(len(w), seg)] = w[:seg]
+    return frames, weights
+
+def tag_batch(items: Sequence[Tuple[np.ndarray, int]], batch_size: int = 16,
+              device: str = "cpu") -> List[Dict[str, float]]:
+    """Classifica vários stems em memória com forward passes em lote.
+
+    Cada stem vira uma ou mais janelas de 10 s (até 6, ver `_windows`); a saída clipwise é
+    a média das janelas ponderada pela duração real de cada uma.
+    """
+    if not items:
+        return []
+    from panns_inference import labels as PANNS_LABELS
+    at = get_tagger(device)
+    frames, weights, owner = [], [], []
+    for idx, (y, sr) in enumerate(items):
+        w, wt = _windows(y, sr)
+        frames.append(w); weights.append(wt); owner += [idx] * len(w)
+    frames, weights, owner = np.concatenate(frames), np.concatenate(weights), np.asarray(owner)
+    out = np.concatenate([at.inference(frames[i:i + batch_size])[0]
+                          for i in range(0, len(frames), batch_size)])
+    results = []
+    for idx in range(len(items)):
+        clip = np.average(out[owner == idx], axis=0, weights=weights[owner == idx])
+        results.append({PANNS_LABELS[i]: float(clip[i]) for i in range(len(PANNS_LABELS))})
+    return results
+
+def tag_array(y: np.ndarray, sr: int) -> Dict[str, float]:
+    return tag_batch([(y, sr)])[0]
+
 def tag_wav(path: str) -> Dict[str, float]:
-    at = AudioTagging(checkpoint_path=None, device="cpu")
-    (clipwise_output, labels, _) = at.inference(path)
-    scores = {labels[i]: float(clipwise_output[0][i]) for i in range(len(labels))}
-    return scores
+    import librosa
+    y, sr = librosa.load(path, sr=PANNS_SR, mono=True)
+    return tag_array(y, sr)
 
 def best_label(scores: Dict[str, float]) -> str:
     best = sorted(scores.items(), key=lambda x: x[1], reverse=True)[:10]
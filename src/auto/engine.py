@@ -1,11 +1,11 @@
-
-import subprocess, sys, os, pathlib
+import subprocess, sys, os, pathlib, glob, threading
+import numpy as np
 from typing import Optional
 
 def run_demucs(input_path: str, out_dir: str, device: str = "cpu",
                model: str = "htdemucs", shifts: int = 0, overlap: float = 0.25,
                mp3: bool = False, bitrate: int = 320):
-    \"\"\"Executa Demucs para 4 stems (htdemucs) ou 6 stems (htdemucs_6s).\"\"\"
+    """Executa Demucs para 4 stems (htdemucs) ou 6 stems (htdemucs_6s)."""
     cmd = [sys.executable, "-m", "demucs.separate",
            "-n", model,
            "--out", out_dir,
@@ -30,3 +30,256 @@ def find_output_folder(out_dir: str, model: str, song_stem: str):
         if d.startswith(song_stem):
             return os.path.join(root, d)
     return cand
+
+class DemucsEngine:
+    """Demucs em processo: carrega o modelo uma vez e devolve os stems como arrays (canais, amostras)."""
+
+    def __init__(self, model: str = "htdemucs", device: str = "cpu"):
+        from demucs.pretrained import get_model
+        self.name = model
+        self.device = device
+        self.model = get_model(model)
+        self.model.to(device)
+        self.model.eval()
+
+    @property
+    def samplerate(self) -> int:
+        return self.model.samplerate
+
+    @property
+    def sources(self):
+        return list(self.model.sources)
+
+    def load(self, input_path: str):
+        """Decodifica a entrada no SR/canais do modelo (tensor (canais, amostras))."""
+        from demucs.audio import AudioFile
+        return AudioFile(pathlib.Path(input_path)).read(streams=0, samplerate=self.samplerate,
+                                                        channels=self.model.audio_channels)
+
+    def separate(self, input_path: str, shifts: int = 0, overlap: float = 0.25, jobs: int = 1):
+        return self.separate_wav(self.load(input_path), shifts=shifts, overlap=overlap, jobs=jobs)
+
+    def separate_wav(self, wav, shifts: int = 0, overlap: float = 0.25, jobs: int = 1):
+        """Separa um tensor (canais, amostras). Com jobs > 1 (só CPU), os segmentos do Demucs
+        rodam num pool de `jobs` processos (ver `apply_segments`)."""
+        import torch
+        from demucs.apply import apply_model
+        ref = wav.mean(0)
+        wav = (wav - ref.mean()) / ref.std()
+        # shifts=0 no CLI equivale ao padrão do demucs.separate (1 shift)
+        shifts = shifts if shifts and shifts > 0 else 1
+        if jobs and jobs > 1 and self.device == "cpu":
+            sources = torch.from_numpy(apply_segments(self, wav.numpy(), shifts, overlap, jobs))
+        else:
+            with torch.no_grad():
+                sources = apply_model(self.model, wav[None], device=self.device, shifts=shifts,
+                                      split=True, overlap=overlap, progress=False)[0]
+        sources = sources * ref.std() + ref.mean()
+        out = sources.cpu().numpy().astype("float32")
+        return {name: out[i] for i, name in enumerate(self.model.sources)}, self.samplerate
+
+_ENGINES = {}
+_ENGINES_LOCK = threading.Lock()
+
+def get_engine(model: str = "htdemucs", device: str = "cpu") -> DemucsEngine:
+    """Engine residente por processo (um modelo carregado por (modelo, device)).
+
+    O carregamento é feito sob lock: dois primeiros usos simultâneos (workers da API,
+    músicas em paralelo) esperam o mesmo modelo em vez de carregar duas cópias.
+    """
+    key = (model, device)
+    with _ENGINES_LOCK:
+        if key not in _ENGINES:
+            _ENGINES[key] = DemucsEngine(model, device)
+        return _ENGINES[key]
+
+# --- Demucs segmentado em processos (CPU) ---
+# Reproduz o apply_model do Demucs (bag de modelos → shifts → segmentos com pesos
+# triangulares e sobreposição `overlap`), mas cada segmento de cada shift vira uma tarefa
+# num pool de processos que mantêm o modelo carregado. Os deslocamentos dos shifts são
+# sorteados com o mesmo `random` e na mesma ordem, e os segmentos são somados na mesma
+# ordem, então o resultado bate com o de um job só (até o arredondamento em float32).
+
+_POOLS = {}
+_POOLS_LOCK = threading.Lock()
+_WORKER = {}
+
+def _init_segment_worker(model: str, threads: int):
+    import torch
+    torch.set_num_threads(threads)
+    _WORKER["engine"] = get_engine(model, "cpu")
+
+def _segment_ready() -> int:
+    return os.getpid()
+
+def _forward_segment(index: int, x: np.ndarray, length: int) -> np.ndarray:
+    """Passa um segmento já com padding pelo sub-modelo `index` e corta o centro (`length` amostras)."""
+    import torch
+    from demucs.apply import BagOfModels
+    from demucs.utils import center_trim
+    model = _WORKER["engine"].model
+    sub = model.models[index] if isinstance(model, BagOfModels) else model
+    with torch.no_grad():
+        out = sub(torch.from_numpy(x)[None])[0]
+    return center_trim(out, length).numpy()
+
+def segment_pool(model: str = "htdemucs", jobs: int = 2):
+    """Pool residente (por processo) de `jobs` workers com o modelo carregado, dividindo os núcleos."""
+    key = (model, jobs)
+    with _POOLS_LOCK:   # um pool só, mesmo com vários primeiros usos simultâneos
+        if key not in _POOLS:
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+            threads = max(1, (os.cpu_count() or 1) // jobs)
+            _POOLS[key] = ProcessPoolExecutor(max_workers=jobs, mp_context=multiprocessing.get_context("spawn"),
+                                              initializer=_init_segment_worker, initargs=(model, threads))
+        return _POOLS[key]
+
+def warm_segment_pool(model: str = "htdemucs", jobs: int = 2):
+    """Sobe os `jobs` workers (cada um carrega o modelo) antes do primeiro job."""
+    pool = segment_pool(model, jobs)
+    return sorted({f.result() for f in [pool.submit(_segment_ready) for _ in range(jobs)]})
+
+def _padded(x: np.ndarray, offset: int, length: int, target: int) -> np.ndarray:
+    """Trecho [offset, offset+length) de x estendido para `target` amostras com o contexto
+    vizinho (zeros fora de x), centrado como o TensorChunk.padded do Demucs."""
+    start = offset - (target - length) // 2
+    end = start + target
+    lo, hi = max(0, start), min(x.shape[-1], end)
+    return np.pad(x[:, lo:hi], ((0, 0), (lo - start, end - hi)))
+
+def _ordered(pool, fn, tasks, window):
+    """(tarefa, resultado) na ordem das tarefas, com no máximo `window` em voo (memória limitada)."""
+    from collections import deque
+    pending = deque()
+    for task in tasks:
+        pending.append((task, pool.submit(fn, *task[1])))
+        if len(pending) >= window:
+            task, fut = pending.popleft()
+            yield task[0], fut.result()
+    while pending:
+        task, fut = pending.popleft()
+        yield task[0], fut.result()
+
+def apply_segments(engine: DemucsEngine, mix: np.ndarray, shifts: int = 1, overlap: float = 0.25,
+                   jobs: int = 2) -> np.ndarray:
+    """Equivalente ao `apply_model(engine.model, mix[None], shifts, split=True, overlap)[0]`
+    com os segmentos (de todos os shifts) espalhados por `jobs` processos. Retorna (fontes, canais, amostras)."""
+    import random
+    from demucs.apply import BagOfModels
+    bag = engine.model
+    models = bag.models if isinstance(bag, BagOfModels) else [bag]
+    bag_weights = bag.weights if isinstance(bag, BagOfModels) else [[1.0] * len(bag.sources)]
+    C, T = mix.shape
+    max_shift = int(0.5 * engine.samplerate)
+    padded = np.pad(mix.astype(np.float32, copy=False), ((0, 0), (max_shift, max_shift)))
+    estimates = np.zeros((len(bag.sources), C, T), dtype=np.float32)
+    totals = np.zeros(len(bag.sources), dtype=np.float32)
+    pool = segment_pool(engine.name, jobs)
+    for index, (sub, inst_weights) in enumerate(zip(models, bag_weights)):
+        seg = int(sub.samplerate * sub.segment)
+        stride = int((1 - overlap) * seg)
+        tri = np.concatenate([np.arange(1, seg // 2 + 1), np.arange(seg - seg // 2, 0, -1)]).astype(np.float32)
+        tri /= tri.max()
+        valid = getattr(sub, "valid_length", lambda n: n)
+        shift_offsets = [random.randint(0, max_shift) for _ in range(shifts)]
+
+        def tasks():
+            for s, off in enumerate(shift_offsets):
+                n = T + max_shift - off
+                for o in range(0, n, stride):
+                    length = min(n - o, seg)
+                    yield (s, o, length), (index, _padded(padded, off + o, length, valid(length)), length)
+
+        out = np.zeros_like(estimates)
+        acc = weight = None
+        for (s, o, length), res in _ordered(pool, _forward_segment, tasks(), 2 * jobs):
+            off = shift_offsets[s]
+            if o == 0:
+                n = T + max_shift - off
+                acc, weight = np.zeros((len(bag.sources), C, n), dtype=np.float32), np.zeros(n, dtype=np.float32)
+            acc[..., o:o + length] += tri[:length] * res
+            weight[o:o + length] += tri[:length]
+            if o + stride >= T + max_shift - off:   # último segmento deste shift
+                acc /= weight
+                out += acc[..., max_shift - off:]
+        out /= shifts
+        w = np.asarray(inst_weights, dtype=np.float32)
+        estimates += out * w[:, None, None]
+        totals += w
+    return estimates / totals[:, None, None]
+
+def _load(path):
+    """Lê um stem como (canais, amostras) float32."""
+    import soundfile as sf
+    try:
+        y, sr0 = sf.read(path, always_2d=True, dtype="float32")
+        return y.T, sr0
+    except Exception:
+        return None, None
+
+def audio_hash(input_path: str) -> str:
+    """Hash do áudio decodificado (para o cache) quando não há engine em processo."""
+    import librosa
+    from auto.cache import array_hash
+    y, sr0 = librosa.load(input_path, sr=None, mono=False)
+    return array_hash(y, np.array([sr0]))
+
+def separate_base(input_path: str, out_dir: str, song: Optional[str] = None, device: str = "cpu",
+                  model: str = "htdemucs", shifts: int = 0, overlap: float = 0.25,
+                  in_process: bool = True, cache=None, mono: bool = False, jobs: int = 1):
+    """Separação base. Retorna (pasta da música, {stem: (y, sr)}), com y em (canais, amostras).
+
+    Em processo usa o engine residente; sem demucs/torch importáveis (ou in_process=False)
+    cai no subprocesso `demucs.separate` e relê os WAVs gerados. Com `cache` (StemCache),
+    os stems base são reaproveitados pelo hash do áudio decodificado + parâmetros. Com
+    jobs > 1 em CPU, os segmentos da música rodam em `jobs` processos (mesmo resultado,
+    então a chave do cache não muda).
+    """
+    from auto.cache import array_hash, cache_key
+    song = song or pathlib.Path(input_path).stem
+    folder = os.path.join(out_dir, model, song)
+    engine = wav = None
+    if in_process:
+        try:
+            engine = get_engine(model, device)
+        except ImportError:
+            engine = None
+    key = None
+    if cache is not None:
+        if engine is not None:
+            wav = engine.load(input_path)
+            digest = array_hash(wav.numpy())
+        else:
+            digest = audio_hash(input_path)
+        key = cache_key(digest, model, shifts, overlap)
+        hit = cache.get("demucs", key)
+        if hit is not None:
+            info, arrays = hit
+            os.makedirs(folder, exist_ok=True)
+            return folder, _downmix({n: (y, info["sr"]) for n, y in zip(info["names"], arrays)}, mono)
+    if engine is not None:
+        if wav is None:
+            wav = engine.load(input_path)
+        stems, sr0 = engine.separate_wav(wav, shifts=shifts, overlap=overlap, jobs=jobs)
+        os.makedirs(folder, exist_ok=True)
+        base_stems = {n: (y, sr0) for n, y in stems.items()}
+    else:
+        run_demucs(input_path, out_dir=out_dir, device=device, model=model, shifts=shifts, overlap=overlap, mp3=False)
+        folder = find_output_folder(out_dir, model, pathlib.Path(input_path).stem)
+        base_stems = {}
+        for name in ["vocals","drums","bass","other","piano","guitar"]:
+            cand = glob.glob(os.path.join(folder, f"{name}.*"))
+            if cand:
+                y, sr0 = _load(cand[0])
+                if y is not None: base_stems[name] = (y, sr0)
+    if key is not None and base_stems:
+        names = list(base_stems)
+        cache.put("demucs", key, {"names": names, "sr": base_stems[names[0]][1]},
+                  [base_stems[n][0] for n in names])
+    return folder, _downmix(base_stems, mono)
+
+def _downmix(base_stems, mono):
+    if not mono:
+        return base_stems
+    return {n: (y.mean(axis=0, dtype=np.float32), sr0) for n, (y, sr0) in base_stems.items()}
@@ -0,0 +1,54 @@
+import numpy as np
+from typing import Optional
+
+GATE_DB = -60.0        # RMS (dBFS) de um quadro para ele contar como ativo
+GATE_ACTIVITY = 0.01   # fração mínima de quadros ativos para o stem seguir no pipeline
+GATE_FRAME = 4096
+
+def activity(y: np.ndarray, gate_db: float = GATE_DB, frame: int = GATE_FRAME) -> dict:
+    """Pico (dBFS) e fração de quadros com RMS acima de `gate_db`, numa passada vetorizada.
+
+    Os quadros não se sobrepõem e a energia é a média dos canais; nada do tamanho do sinal
+    é alocado (o quadrado é somado por `einsum`).
+    """
+    x = np.asarray(y)
+    if x.size == 0:
+        return {"peak_db": -np.inf, "active": 0.0}
+    x = x.reshape(-1, x.shape[-1])
+    C, n = x.shape
+    nf = n // frame
+    ms = np.einsum("cfn,cfn->f", x[:, :nf * frame].reshape(C, nf, frame),
+                   x[:, :nf * frame].reshape(C, nf, frame)) / (C * frame)
+    tail = x[:, nf * frame:]
+    if tail.size:
+        ms = np.append(ms, np.einsum("ct,ct->", tail, tail) / tail.size)
+    peak = max(float(x.max()), -float(x.min()))
+    return {"peak_db": float(20 * np.log10(peak)) if peak > 0 else -np.inf,
+            "active": float(np.mean(ms > 10 ** (gate_db / 10)))}
+
+def gate_reason(y: np.ndarray, gate_db: float = GATE_DB, min_activity: float = GATE_ACTIVITY) -> Optional[str]:
+    """None se o stem tem atividade suficiente; senão o motivo do descarte (para o relatório)."""
+    a = activity(y, gate_db)
+    if a["active"] >= min_activity:
+        return None
+    if a["active"] == 0:
+        return f"silencioso: nenhum trecho acima de {gate_db:g} dBFS (pico {a['peak_db']:.1f} dBFS)"
+    return (f"pouca atividade: {a['active']:.1%} do tempo acima de {gate_db:g} dBFS "
+            f"(mínimo {min_activity:.1%})")
+
+class StemGate:
+    """Descarta stems/componentes quase silenciosos antes dos estágios caros e guarda o motivo.
+
+    `skipped` acumula {"name", "stage", "reason"} de cada descarte (seguro entre threads:
+    só há `append`).
+    """
+
+    def __init__(self, gate_db: float = GATE_DB, min_activity: float = GATE_ACTIVITY):
+        self.gate_db, self.min_activity = gate_db, min_activity
+        self.skipped = []
+
+    def keep(self, name: str, y: np.ndarray, stage: str) -> bool:
+        reason = gate_reason(y, self.gate_db, self.min_activity)
+        if reason is not None:
+            self.skipped.append({"name": name, "stage": stage, "reason": reason})
+        return reason is None
@@ -0,0 +1,154 @@
+import json, os, queue, sqlite3, threading, time, uuid
+from typing import Callable, Optional
+
+class JobCancelled(Exception):
+    pass
+
+class QueueFull(Exception):
+    pass
+
+def _discard(path: Optional[str]):
+    try: os.remove(path)
+    except OSError: pass
+
+class JobStore:
+    """Estado dos jobs em SQLite (uma conexão por operação, seguro entre threads)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with self._conn() as c:
+            c.execute("""CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY, song TEXT, input TEXT, params TEXT,
+                status TEXT, stage TEXT, progress REAL, result TEXT, error TEXT,
+                cancel INTEGER DEFAULT 0, created REAL, updated REAL)""")
+            cols = {r[1] for r in c.execute("PRAGMA table_info(jobs)")}
+            if "stems" not in cols:
+                c.execute("ALTER TABLE jobs ADD COLUMN stems TEXT DEFAULT '[]'")
+            if "metrics" not in cols:
+                c.execute("ALTER TABLE jobs ADD COLUMN metrics TEXT")
+
+    def _conn(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def create(self, song: str, input_path: str, params: dict) -> str:
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._conn() as c:
+            c.execute("INSERT INTO jobs (id, song, input, params, status, stage, progress, created, updated) "
+                      "VALUES (?, ?, ?, ?, 'queued', '', 0, ?, ?)",
+                      (job_id, song, input_path, json.dumps(params), now, now))
+        return job_id
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._conn() as c:
+            c.row_factory = sqlite3.Row
+            row = c.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["params"] = json.loads(job["params"] or "{}")
+        job["stems"] = json.loads(job["stems"] or "[]")
+        job["metrics"] = json.loads(job["metrics"]) if job["metrics"] else None
+        return job
+
+    def add_stem(self, job_id: str, stem: dict):
+        """Registra um stem finalizado (leitura+escrita na mesma transação)."""
+        c = self._conn()
+        try:
+            c.execute("BEGIN IMMEDIATE")
+            row = c.execute("SELECT stems FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            stems = json.loads(row[0] or "[]") + [stem]
+            c.execute("UPDATE jobs SET stems = ?, updated = ? WHERE id = ?", (json.dumps(stems), time.time(), job_id))
+            c.commit()
+        finally:
+            c.close()
+
+    def update(self, job_id: str, **fields):
+        fields["updated"] = time.time()
+        cols = ", ".join(f"{k} = ?" for k in fields)
+        with self._conn() as c:
+            c.execute(f"UPDATE jobs SET {cols} WHERE id = ?", (*fields.values(), job_id))
+
+    def transition(self, job_id: str, expected: str, **fields) -> bool:
+        """Atualiza o job só se ele ainda está em `expected` (verificar e gravar numa única
+        instrução, sem corrida entre o cancelamento e os workers). True se atualizou."""
+        fields["updated"] = time.time()
+        cols = ", ".join(f"{k} = ?" for k in fields)
+        with self._conn() as c:
+            cur = c.execute(f"UPDATE jobs SET {cols} WHERE id = ? AND status = ?", (*fields.values(), job_id, expected))
+        return cur.rowcount == 1
+
+    def all_metrics(self, limit: int = 100):
+        """Métricas dos últimos `limit` jobs concluídos (mais recentes primeiro)."""
+        with self._conn() as c:
+            rows = c.execute("SELECT metrics FROM jobs WHERE status = 'done' AND metrics IS NOT NULL "
+                             "ORDER BY updated DESC LIMIT ?", (limit,)).fetchall()
+        return [json.loads(r[0]) for r in rows]
+
+    def ids(self, status: str):
+        with self._conn() as c:
+            return [r[0] for r in c.execute("SELECT id FROM jobs WHERE status = ? ORDER BY created", (status,))]
+
+class JobQueue:
+    """Fila limitada + pool de workers (threads) que executam `handler(job, progress)`.
+
+    Os workers compartilham os modelos residentes do processo (engine Demucs, tagger).
+    `progress(stage, fração)` atualiza o job e levanta JobCancelled se o cancelamento foi
+    pedido, então o cancelamento acontece entre estágios.
+    """
+
+    def __init__(self, store: JobStore, handler: Callable, workers: int = 1, maxsize: int = 8):
+        self.store, self.handler = store, handler
+        self.q = queue.Queue(maxsize=maxsize)
+        for job_id in store.ids("running"):
+            store.update(job_id, status="failed", error="interrompido (reinício do servidor)")
+        for job_id in store.ids("queued"):
+            try: self.q.put_nowait(job_id)
+            except queue.Full: store.update(job_id, status="failed", error="fila cheia no reinício")
+        for _ in range(max(1, workers)):
+            threading.Thread(target=self._work, daemon=True).start()
+
+    def submit(self, song: str, input_path: str, params: dict) -> str:
+        job_id = self.store.create(song, input_path, params)
+        try:
+            self.q.put_nowait(job_id)
+        except queue.Full:
+            self.store.update(job_id, status="failed", error="fila cheia")
+            raise QueueFull(job_id)
+        return job_id
+
+    def cancel(self, job_id: str) -> Optional[dict]:
+        job = self.store.get(job_id)
+        if job is None:
+            return None
+        if self.store.transition(job_id, "queued", status="cancelled", cancel=1):
+            _discard(job["input"])   # o worker vai só descartar o id da fila
+        else:   # já em execução (ou encerrado): o worker para no próximo estágio
+            self.store.transition(job_id, "running", cancel=1)
+        return self.store.get(job_id)
+
+    def _progress(self, job_id: str, stage: str, frac: float):
+        job = self.store.get(job_id)
+        if job and job["cancel"]:
+            raise JobCancelled(job_id)
+        self.store.update(job_id, stage=stage, progress=float(frac))
+
+    def _work(self):
+        while True:
+            job_id = self.q.get()
+            job = self.store.get(job_id)
+            if job is None:
+                continue
+            if not self.store.transition(job_id, "queued", status="running"):
+                if self.store.get(job_id)["status"] == "cancelled":
+                    _discard(job["input"])
+                continue
+            try:
+                result = self.handler(job, lambda stage, frac: self._progress(job_id, stage, frac))
+                self.store.transition(job_id, "running", status="done", stage="done", progress=1.0, result=result)
+            except JobCancelled:
+                self.store.transition(job_id, "running", status="cancelled")
+            except Exception as e:
+                self.store.transition(job_id, "running", status="failed", error=str(e))
+            finally:
+                _discard(job["input"])
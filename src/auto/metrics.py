@@ -0,0 +1,104 @@
+import json, sys, threading, time
+from contextlib import contextmanager
+
+def peak_rss_mb() -> float:
+    """Pico de RSS do processo até agora (MB); 0 onde `resource` não existe (Windows)."""
+    try:
+        import resource
+    except ImportError:
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+class SongMetrics:
+    """Tempo de parede, tempo de CPU e pico de RSS por estágio de uma música.
+
+    Um estágio pode rodar em vários workers ao mesmo tempo (ex.: encode de cada stem):
+    `wall_s` e `cpu_s` cobrem só a união dos intervalos em que ele esteve ativo, contada
+    uma vez, e `busy_s` soma a duração de cada execução (≈ wall_s × paralelismo). O tempo
+    de CPU é o do processo inteiro (inclui, com várias músicas em paralelo, as outras
+    músicas). O pico de RSS é o do processo ao fim do estágio: é monotônico, então o
+    estágio que mais o aumenta é o que define a memória. `total_s` vai do início da
+    música até `finish()` (ou até agora), não é a soma dos estágios, que se sobrepõem.
+    """
+
+    def __init__(self, song: str = ""):
+        self.song = song
+        self.stages = {}
+        self.start, self.end = time.perf_counter(), None
+        self._open = {}   # estágio -> (execuções ativas, parede e CPU de quando abriu)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name: str):
+        wall = time.perf_counter()
+        with self._lock:
+            active, opened_wall, opened_cpu = self._open.get(name, (0, wall, time.process_time()))
+            self._open[name] = (active + 1, opened_wall, opened_cpu)
+        try:
+            yield
+        finally:
+            now = time.perf_counter()
+            with self._lock:
+                active, opened_wall, opened_cpu = self._open.pop(name)
+                if active > 1:
+                    self._open[name] = (active - 1, opened_wall, opened_cpu)
+                    self._add(name, 0.0, 0.0, now - wall)
+                else:
+                    self._add(name, now - opened_wall, time.process_time() - opened_cpu, now - wall)
+
+    def add(self, name: str, wall_s: float, cpu_s: float = 0.0):
+        with self._lock:
+            self._add(name, wall_s, cpu_s, wall_s)
+
+    def _add(self, name, wall_s, cpu_s, busy_s):
+        st = self.stages.setdefault(name, {"wall_s": 0.0, "cpu_s": 0.0, "busy_s": 0.0, "peak_rss_mb": 0.0})
+        st["wall_s"] += wall_s
+        st["cpu_s"] += cpu_s
+        st["busy_s"] += busy_s
+        st["peak_rss_mb"] = max(st["peak_rss_mb"], peak_rss_mb())
+
+    def finish(self):
+        self.end = time.perf_counter()
+
+    @property
+    def total_s(self) -> float:
+        return (self.end or time.perf_counter()) - self.start
+
+    def to_dict(self) -> dict:
+        return {"song": self.song, "total_s": self.total_s, "peak_rss_mb": peak_rss_mb(),
+                "stages": {n: dict(st) for n, st in self.stages.items()}}
+
+    def summary(self) -> str:
+        return " | ".join(f"{n} {st['wall_s']:.1f}s" for n, st in self.stages.items()) + \
+            f" | total {self.total_s:.1f}s | pico {peak_rss_mb():.0f} MB"
+
+@contextmanager
+def timed(metrics, name: str):
+    """`metrics.stage(name)` quando há métricas; senão não faz nada."""
+    if metrics is None:
+        yield
+    else:
+        with metrics.stage(name):
+            yield
+
+def aggregate(runs) -> dict:
+    """Totais e médias por estágio de várias músicas (dicts de `SongMetrics.to_dict`)."""
+    out = {}
+    for run in runs:
+        for name, st in run.get("stages", {}).items():
+            agg = out.setdefault(name, {"count": 0, "wall_s": 0.0, "cpu_s": 0.0, "busy_s": 0.0,
+                                        "peak_rss_mb": 0.0})
+            agg["count"] += 1
+            agg["wall_s"] += st["wall_s"]
+            agg["cpu_s"] += st["cpu_s"]
+            agg["busy_s"] += st.get("busy_s", st["wall_s"])
+            agg["peak_rss_mb"] = max(agg["peak_rss_mb"], st["peak_rss_mb"])
+    for agg in out.values():
+        agg["mean_wall_s"] = agg["wall_s"] / agg["count"]
+    return out
+
+def write_json(path: str, data):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+    return path
@@ -0,0 +1,105 @@
+import numpy as np
+
+BETAS = {"frobenius": 2.0, "kl": 1.0, "is": 0.0}
+EPS = 1e-9
+
+def beta_divergence(X, WH, beta=2.0) -> float:
+    """Divergência beta média por célula (2 = Frobenius/2, 1 = KL, 0 = Itakura–Saito)."""
+    WH = WH + EPS
+    if beta == 2:
+        return float(0.5 * np.sum((X - WH) ** 2) / X.size)
+    Xe = X + EPS
+    if beta == 1:
+        return float(np.sum(Xe * np.log(Xe / WH) - Xe + WH) / X.size)
+    if beta == 0:
+        r = Xe / WH
+        return float(np.sum(r - np.log(r) - 1) / X.size)
+    return float(np.sum((Xe**beta + (beta - 1) * WH**beta - beta * Xe * WH**(beta - 1))
+                        / (beta * (beta - 1))) / X.size)
+
+class SVDInit:
+    """NNDSVDa compartilhado entre os k: uma SVD truncada em max_k, recortada para cada k."""
+
+    def __init__(self, X, max_k, random_state=0):
+        from sklearn.utils.extmath import randomized_svd
+        self.U, self.S, self.V = randomized_svd(X, max_k, random_state=random_state)
+        self.avg = float(X.mean())
+        self.dtype = X.dtype
+
+    def __call__(self, k):
+        U, S, V = self.U, self.S, self.V
+        W = np.zeros((U.shape[0], k)); H = np.zeros((k, V.shape[1]))
+        W[:, 0] = np.sqrt(S[0]) * np.abs(U[:, 0])
+        H[0] = np.sqrt(S[0]) * np.abs(V[0])
+        for j in range(1, k):
+            x, y = U[:, j], V[j]
+            xp, yp, xn, yn = np.maximum(x, 0), np.maximum(y, 0), np.maximum(-x, 0), np.maximum(-y, 0)
+            nxp, nyp, nxn, nyn = (np.linalg.norm(a) for a in (xp, yp, xn, yn))
+            if nxp * nyp > nxn * nyn:
+                u, v, sigma = xp / max(nxp, EPS), yp / max(nyp, EPS), nxp * nyp
+            else:
+                u, v, sigma = xn / max(nxn, EPS), yn / max(nyn, EPS), nxn * nyn
+            W[:, j] = np.sqrt(S[j] * sigma) * u
+            H[j] = np.sqrt(S[j] * sigma) * v
+        W[W < EPS] = self.avg
+        H[H < EPS] = self.avg
+        return W.astype(self.dtype), H.astype(self.dtype)
+
+class SklearnNMF:
+    """Referência: sklearn.decomposition.NMF (float64; cd para Frobenius, mu para KL/IS)."""
+
+    def __init__(self, beta="frobenius", max_iter=400, tol=1e-4, random_state=0):
+        self.beta, self.max_iter, self.tol, self.random_state = BETAS[beta], max_iter, tol, random_state
+
+    def fit(self, X, k, init=None):
+        from sklearn.decomposition import NMF
+        kw = {} if self.beta == 2 else {"solver": "mu", "beta_loss": self.beta}
+        nmf = NMF(n_components=k, init="nndsvda" if init is None else "custom", max_iter=self.max_iter,
+                  tol=self.tol, random_state=self.random_state, **kw)
+        if init is None:
+            W = nmf.fit_transform(X)
+        else:
+            W = nmf.fit_transform(X, W=init[0].astype(X.dtype), H=init[1].astype(X.dtype))
+        return W, nmf.components_
+
+class MultiplicativeNMF:
+    """Atualizações multiplicativas em NumPy, em float32, com divergência beta e parada por convergência.
+
+    A cada `check` iterações mede a divergência e para quando a queda desde a última medida,
+    relativa à divergência inicial, fica abaixo de `tol` (o mesmo critério do solver mu do sklearn).
+    """
+
+    def __init__(self, beta="frobenius", max_iter=400, tol=1e-4, random_state=0, check=10):
+        self.beta, self.max_iter, self.tol = BETAS[beta], max_iter, tol
+        self.random_state, self.check = random_state, check
+
+    def fit(self, X, k, init=None):
+        X = X.astype(np.float32, copy=False)
+        if init is None:
+            init = SVDInit(X, k, self.random_state)(k)
+        W, H = (a.astype(np.float32, copy=True) for a in init)
+        b = self.beta
+        prev = first = beta_divergence(X, W @ H, b)
+        for it in range(self.max_iter):
+            if b == 2:
+                H *= (W.T @ X) / ((W.T @ W) @ H + EPS)
+                W *= (X @ H.T) / (W @ (H @ H.T) + EPS)
+            elif b == 1:
+                H *= (W.T @ (X / (W @ H + EPS))) / (W.sum(axis=0)[:, None] + EPS)
+                W *= ((X / (W @ H + EPS)) @ H.T) / (H.sum(axis=1)[None, :] + EPS)
+            else:
+                WH = W @ H + EPS
+                H *= (W.T @ (X * WH ** (b - 2))) / (W.T @ WH ** (b - 1) + EPS)
+                WH = W @ H + EPS
+                W *= ((X * WH ** (b - 2)) @ H.T) / (WH ** (b - 1) @ H.T + EPS)
+            if (it + 1) % self.check == 0:
+                err = beta_divergence(X, W @ H, b)
+                if (prev - err) / max(first, EPS) < self.tol:
+                    break
+                prev = err
+        return W, H
+
+NMF_BACKENDS = {"sklearn": SklearnNMF, "mu": MultiplicativeNMF}
+
+def get_backend(name="sklearn", **opts):
+    return NMF_BACKENDS[name](**opts)
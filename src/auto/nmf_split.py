@@ -1,8 +1,8 @@
 
-import os, numpy as np
+import os, tempfile, numpy as np
 import soundfile as sf
 import librosa
-from sklearn.decomposition import NMF
+from auto.nmf_backends import BETAS, SVDInit, beta_divergence, get_backend
 
 def stft_mag(y, n_fft=2048, hop_length=512):
     S = librosa.stft(y, n_fft=n_fft, hop_length=hop_length)
@@ -13,34 +13,238 @@ def istft_mag(M, phase, hop_length=512):
     y = librosa.istft(S, hop_length=hop_length)
     return y
 
-def auto_k_nmf(mag, max_k=6, random_state=0):
-    errs = []
-    Ws, Hs = [], []
-    for k in range(1, max_k+1):
-        nmf = NMF(n_components=k, init="nndsvda", max_iter=400, random_state=random_state)
-        W = nmf.fit_transform(mag)
-        H = nmf.components_
-        recon = W @ H
-        err = np.linalg.norm(mag - recon) / (mag.size**0.5)
-        errs.append(err)
-        Ws.append(W); Hs.append(H)
+def _fit_nmf(mag, k, solver, init=None, beta=2.0):
+    """Ajusta NMF com k componentes no backend `solver`; `init=(W, H)` faz warm start."""
+    W, H = solver.fit(mag, k, init=init)
+    if beta == 2:
+        err = np.linalg.norm(mag - W @ H) / (mag.size**0.5)
+    else:
+        err = beta_divergence(mag, W @ H, beta)
+    return W, H, err
+
+def _grow(mag, W, H):
+    """Warm start para k+1: mantém W/H e inicializa a nova coluna pelo residual positivo (rank-1)."""
+    R = np.maximum(mag - W @ H, 0)
+    w = R.mean(axis=1) + 1e-6
+    h = (w @ R) / (w @ w) + 1e-6
+    return (np.hstack([W, w[:, None]]).astype(mag.dtype),
+            np.vstack([H, h[None, :]]).astype(mag.dtype))
+
+def auto_k_nmf(mag, max_k=6, random_state=0, tol=0.05, strategy="linear", warm_start=False,
+               backend="sklearn", beta="frobenius", shared_init=False, solver_tol=1e-4):
+    """Escolhe K pelo joelho do erro: o primeiro k cuja passagem para k+1 reduz o erro < tol.
+
+    strategy="linear" testa k=1,2,... e para assim que o joelho aparece (mesmo K da busca
+    completa). strategy="bisect" faz busca binária do joelho, supondo que a queda relativa
+    do erro decresce com k; útil para max_k grande. warm_start=True inicia cada k a partir
+    da fatoração k-1 em vez de refazer o nndsvda (mais rápido, pode mudar o K escolhido).
+    backend="sklearn" (referência) ou "mu" (atualizações multiplicativas em float32);
+    beta="frobenius", "kl" ou "is"; shared_init=True faz uma só SVD para todos os k.
+    Retorna W, H, K e errs (erro por k; nan onde k não foi avaliado).
+    """
+    max_k = max(1, max_k)
+    solver = get_backend(backend, beta=beta, tol=solver_tol, random_state=random_state)
+    svd = SVDInit(mag, min(max_k, *mag.shape), random_state) if shared_init else None
+    fits, err_k = {}, {}
+    def fit(k):
+        if k not in fits:
+            prev = fits.get(k - 1) if warm_start else None
+            init = _grow(mag, *prev[:2]) if prev else (svd(k) if svd else None)
+            fits[k] = _fit_nmf(mag, k, solver, init=init, beta=BETAS[beta])
+            err_k[k] = fits[k][2]
+        return fits[k]
+    def knee(k):
+        e0, e1 = fit(k)[2], fit(k + 1)[2]
+        return (e0 - e1) / max(e0, 1e-6) < tol
+
     best_k = max_k
-    for i in range(1, len(errs)):
-        drop = (errs[i-1] - errs[i]) / max(errs[i-1], 1e-6)
-        if drop < 0.05:
-            best_k = i
+    if strategy == "bisect":
+        lo, hi = 1, max_k
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if knee(mid): hi = mid
+            else: lo = mid + 1
+        best_k = lo
+    else:
+        for k in range(1, max_k):
+            if knee(k):
+                best_k = k
+                break
+            fits.pop(k - 1, None)
+    W, H, _ = fit(best_k)
+    last = max_k if strategy == "bisect" else max(err_k)
+    errs = [err_k.get(k, float("nan")) for k in range(1, last + 1)]
+    return W, H, best_k, errs
+
+# resolução da fatoração: (n_mels, pooling no tempo); "full" usa a STFT inteira
+NMF_RESOLUTIONS = {"full": None, "high": (160, 1), "medium": (96, 2), "low": (48, 4)}
+
+def reduce_mag(M, sr, n_mels=96, time_pool=2, n_fft=2048):
+    """Comprime |STFT| em bandas mel e faz média de `time_pool` frames. Retorna (X, filtros mel)."""
+    fb = librosa.filters.mel(sr=sr, n_fft=n_fft, n_mels=n_mels).astype(M.dtype)
+    X = fb @ M
+    if time_pool > 1:
+        pad = (-X.shape[1]) % time_pool
+        X = np.pad(X, ((0, 0), (0, pad)), mode="edge")
+        X = X.reshape(n_mels, -1, time_pool).mean(axis=2)
+    return X, fb
+
+def expand_factors(M, W, H, fb, time_pool=2, n_iter=30):
+    """Leva W/H da resolução reduzida para a STFT completa.
+
+    H é interpolado linearmente no tempo; W parte da projeção transposta dos filtros mel e é
+    refinado por atualizações multiplicativas com H fixo (só matrizes F×K e K×K por iteração).
+    """
+    T = M.shape[1]
+    if time_pool > 1:
+        centers = (np.arange(H.shape[1]) + 0.5) * time_pool - 0.5
+        H = np.stack([np.interp(np.arange(T), centers, h) for h in H])
+    H = H.astype(M.dtype)
+    W = (fb.T @ W).astype(M.dtype) + 1e-9
+    MHt, HHt = M @ H.T, H @ H.T
+    for _ in range(n_iter):
+        W *= MHt / (W @ HHt + 1e-9)
+    return W, H
+
+def _factorize(M, sr, max_k=6, resolution="full", **nmf_kw):
+    reduced = NMF_RESOLUTIONS[resolution]
+    if not reduced:
+        return auto_k_nmf(M, max_k=max_k, **nmf_kw)
+    X, fb = reduce_mag(M, sr, *reduced)
+    W, H, k, errs = auto_k_nmf(X, max_k=max_k, **nmf_kw)
+    W, H = expand_factors(M, W, H, fb, reduced[1])
+    return W, H, k, errs
+
+def mix_mag(S):
+    """Magnitude usada na fatoração: do canal único ou do mid (média complexa dos canais)."""
+    return np.abs(S.mean(axis=0)) if S.ndim > 2 else np.abs(S)
+
+def _components(W, H, S, length=None, chunk=1024, group=1):
+    """Máscaras suaves W_i H_i / WH de todos os componentes, aplicadas à STFT complexa S.
+
+    WH é calculado uma vez; os componentes são invertidos em grupos de `group` (istft em
+    lote), direto num buffer de saída no domínio do tempo. Só o espectro complexo do
+    grupo atual existe de cada vez, nunca os K. S pode ser (F, T) ou (canais, F, T).
+    """
+    W, H = W.astype(np.float32), H.astype(np.float32)
+    k, n_frames = W.shape[1], S.shape[-1]
+    lead = (1,) * (S.ndim - 2)
+    length = length or 512 * (n_frames - 1)
+    inv = np.empty((W.shape[0], n_frames), dtype=np.float32)
+    for t0 in range(0, n_frames, chunk):
+        inv[:, t0:t0 + chunk] = 1.0 / (W @ H[:, t0:t0 + chunk] + 1e-9)
+    out = np.empty((k,) + S.shape[:-2] + (length,), dtype=np.float32)
+    spec = np.empty((min(group, k),) + S.shape, dtype=np.complex64)
+    for i0 in range(0, k, group):
+        g = min(group, k - i0)
+        for t0 in range(0, n_frames, chunk):
+            parts = W.T[i0:i0 + g, :, None] * H[i0:i0 + g, None, t0:t0 + chunk]
+            parts *= inv[:, t0:t0 + chunk]
+            spec[:g, ..., t0:t0 + chunk] = parts.reshape(g, *lead, *parts.shape[1:]) * S[None, ..., t0:t0 + chunk]
+        out[i0:i0 + g] = librosa.istft(spec[:g], hop_length=512, length=length)
+    return list(out)
+
+def split_nmf(y, sr, max_k=6, sr_target=None, resolution="full", **nmf_kw):
+    """Auto-K NMF sobre um array já decodificado, mono ou (canais, amostras).
+
+    As máscaras são aprendidas na magnitude do mid e aplicadas a cada canal, então os
+    componentes saem com os mesmos canais da entrada. `resolution` (full/high/medium/low)
+    fatora uma versão mel/decimada do espectrograma e projeta W/H de volta para construir
+    as máscaras na resolução completa.
+    """
+    y = np.asarray(y, dtype=np.float32)
+    if sr_target and sr_target != sr:
+        y = librosa.resample(y, orig_sr=sr, target_sr=sr_target)
+        sr = sr_target
+    S = librosa.stft(y, n_fft=2048, hop_length=512)
+    W, H, k, errs = _factorize(mix_mag(S), sr, max_k=max_k, resolution=resolution, **nmf_kw)
+    return _components(W, H, S, length=y.shape[-1]), sr, k, errs
+
+def solve_h(W, M, n_iter=100, beta="frobenius"):
+    """Ativações H ≥ 0 para W fixo (atualizações multiplicativas com a mesma divergência do ajuste)."""
+    b = BETAS[beta]
+    W = W.astype(M.dtype)
+    H = np.full((W.shape[1], M.shape[1]), max(float(M.mean()), 1e-9) / W.shape[1], dtype=M.dtype)
+    if b == 2:
+        WtM, WtW = W.T @ M, W.T @ W
+        for _ in range(n_iter):
+            H *= WtM / (WtW @ H + 1e-9)
+        return H
+    for _ in range(n_iter):
+        WH = W @ H + 1e-9
+        H *= (W.T @ (M * WH ** (b - 2))) / (W.T @ WH ** (b - 1) + 1e-9)
+    return H
+
+class _Reader:
+    """Leitura por intervalos, como (canais, n) ou 1-D, de um caminho de áudio (sem carregar tudo) ou de um array."""
+
+    def __init__(self, src, sr=None):
+        if isinstance(src, (str, os.PathLike)):
+            self.f = sf.SoundFile(src)
+            self.sr, self.n, self.channels = self.f.samplerate, self.f.frames, self.f.channels
+        else:
+            self.f, self.y = None, src
+            self.sr, self.n = sr, src.shape[-1]
+            self.channels = src.shape[0] if src.ndim > 1 else 1
+
+    def read(self, start, n):
+        if self.f is None:
+            return np.asarray(self.y[..., start:start + n], dtype=np.float32)
+        self.f.seek(start)
+        x = self.f.read(n, dtype="float32", always_2d=True).T
+        return x if self.channels > 1 else x[0]
+
+def split_nmf_stream(src, sr=None, max_k=6, sr_target=None, block_s=20.0, overlap_s=1.0,
+                     sample_s=60.0, resolution="full", **nmf_kw):
+    """NMF em blocos para entradas longas, com memória limitada pelo tamanho do bloco.
+
+    W e K são aprendidos num extrato de ~`sample_s` segundos espalhado pela faixa; depois
+    cada bloco (com `overlap_s` de sobreposição) tem H calculado com W fixo e cada componente
+    é somado por overlap-add com crossfade linear direto na saída. `src` é um caminho ou um
+    array (mono ou (canais, amostras)); as saídas são memmaps float32 em arquivos
+    temporários anônimos, com os canais da entrada.
+    """
+    rd = _Reader(src, sr)
+    sr_out = sr_target or rd.sr
+    ratio = sr_out / rd.sr
+    def read(start, n):
+        x = rd.read(start, n)
+        return librosa.resample(x, orig_sr=rd.sr, target_sr=sr_out) if ratio != 1 else x
+
+    n_ex = max(1, int(sample_s // 5))
+    ex_len = min(rd.n, int(5 * rd.sr))
+    starts = np.linspace(0, rd.n - ex_len, n_ex).astype(int) if n_ex > 1 else [0]
+    sample = np.concatenate([read(s0, ex_len) for s0 in starts], axis=-1)
+    Ms = mix_mag(librosa.stft(sample, n_fft=2048, hop_length=512))
+    W, _, k, errs = _factorize(Ms, sr_out, max_k=max_k, resolution=resolution, **nmf_kw)
+    del sample, Ms
+
+    n_out = int(np.ceil(rd.n * ratio))
+    shape = (rd.channels, n_out) if rd.channels > 1 else (n_out,)
+    outs = [np.memmap(tempfile.TemporaryFile(), dtype=np.float32, mode="w+", shape=shape)
+            for _ in range(k)]
+    block, ov = int(block_s * rd.sr), int(overlap_s * rd.sr)
+    hop = max(1, block - ov)
+    for start in range(0, rd.n, hop):
+        x = read(start, min(block, rd.n - start))
+        S = librosa.stft(x, n_fft=2048, hop_length=512)
+        H = solve_h(W, mix_mag(S), beta=nmf_kw.get("beta", "frobenius"))
+        comps = _components(W, H, S, length=x.shape[-1])
+        o0 = int(round(start * ratio))
+        m = min(x.shape[-1], n_out - o0)
+        fade = np.ones(m, dtype=np.float32)
+        ov_out = min(int(round(ov * ratio)), m)
+        if start > 0 and ov_out:
+            fade[:ov_out] = np.linspace(0, 1, ov_out, dtype=np.float32)
+        last = start + block >= rd.n
+        if not last and ov_out:
+            fade[m - ov_out:] *= np.linspace(1, 0, ov_out, dtype=np.float32)
+        for out, yi in zip(outs, comps):
+            out[..., o0:o0 + m] += yi[..., :m] * fade
+        if last:
             break
-    return Ws[best_k-1], Hs[best_k-1], best_k, errs
-
-def split_file_nmf(path_wav: str, max_k=6, sr_target=None):
-    y, sr = librosa.load(path_wav, sr=sr_target, mono=True)
-    S, M, P = stft_mag(y)
-    W, H, k, errs = auto_k_nmf(M, max_k=max_k)
-    comps = []
-    recon = W @ H + 1e-9
-    for i in range(k):
-        Mi = (W[:, [i]] @ H[[i], :])
-        mask = Mi / recon
-        yi = istft_mag(mask * M, P)
-        comps.append(yi.astype(np.float32))
-    return comps, sr, k, errs
+    return outs, sr_out, k, errs
+
+def split_file_nmf(path_wav: str, max_k=6, sr_target=None, **nmf_kw):
+    y, sr = librosa.load(path_wav, sr=sr_target, mono=False)
+    return split_nmf(y, sr, max_k=max_k, **nmf_kw)
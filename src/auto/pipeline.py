@@ -0,0 +1,128 @@
+import os
+from typing import Callable, List
+import numpy as np
+
+from auto.cache import array_hash, cache_key
+from auto.metrics import timed
+from auto.crossover import DRUM_CROSSOVERS, band_names, band_split
+
+# os módulos pesados (NMF/librosa, PANNs/torch, pyloudnorm, relatório) são importados
+# dentro do estágio que os usa, para o CLI/API subirem rápido
+
+class Stem:
+    """Stem em memória que atravessa os estágios: um decode na entrada, um encode na saída."""
+
+    def __init__(self, name: str, y: np.ndarray, sr: int):
+        self.name, self.y, self.sr = name, y, sr
+        self.label, self.confidence, self.path = "desconhecido", 0.0, None
+
+    def meta(self) -> dict:
+        return {"name": self.name, "path": self.path, "label": self.label, "confidence": self.confidence}
+
+def default_workers(workers: int = 0) -> int:
+    return workers if workers and workers > 0 else (os.cpu_count() or 1)
+
+def _keep(gate, name, y, stage, metrics) -> bool:
+    if gate is None:
+        return True
+    with timed(metrics, "gate"):
+        return gate.keep(name, y, stage)
+
+def _base_branch(n, y, sr0, gate, metrics):
+    return [Stem(n, y, sr0)] if _keep(gate, n, y, "demucs", metrics) else []
+
+def _nmf_branch(n, y, sr0, max_extra, sr_target, nmf_opts, stream_over, cache, metrics, gate=None):
+    if not _keep(gate, n, y, "demucs", metrics):
+        return []
+    streamed = bool(stream_over and y.shape[-1] / sr0 > stream_over)
+    key = hit = None
+    if cache is not None:
+        key = cache_key(array_hash(y), sr0, max_extra, sr_target, nmf_opts or {}, streamed)
+        hit = cache.get("nmf", key)
+    if hit is not None:
+        comps, sr1 = hit[1], hit[0]["sr"]
+    else:
+        from auto.nmf_split import split_nmf, split_nmf_stream
+        split = split_nmf_stream if streamed else split_nmf
+        with timed(metrics, "nmf"):
+            comps, sr1, k, errs = split(y, sr0, max_k=max_extra, sr_target=sr_target, **(nmf_opts or {}))
+        if key is not None:
+            cache.put("nmf", key, {"sr": sr1, "k": k}, comps)
+    stems = [Stem(f"{n}_comp{i}", yi, sr1) for i, yi in enumerate(comps, start=1)]
+    return [s for s in stems if _keep(gate, s.name, s.y, "nmf", metrics)]
+
+def _drum_branch(y, sr0, crossovers, metrics, gate=None):
+    if not _keep(gate, "drums", y, "demucs", metrics):
+        return []
+    with timed(metrics, "drum_split"):
+        bands = band_split(y, sr0, crossovers)
+    stems = [Stem(f"drums_{name}", yb, sr0) for name, yb in zip(band_names(len(bands)), bands)]
+    return [s for s in stems if _keep(gate, s.name, s.y, "drum_split", metrics)]
+
+def stem_branches(base_stems: dict, drum_split: bool = False, max_extra: int = 6,
+                  sr_target=None, nmf_opts: dict = None, stream_over: float = 0,
+                  cache=None, metrics=None, drum_crossovers=DRUM_CROSSOVERS,
+                  gate=None) -> List[Callable[[], List[Stem]]]:
+    """Ramos independentes a partir dos stems base, na ordem final dos stems.
+
+    Cada ramo é uma função sem argumentos que devolve seus stems: vocals/bass diretos,
+    bateria (ou bandas separadas em `drum_crossovers` Hz) e um NMF por residual. Podem
+    rodar em paralelo entre si. Com `gate` (StemGate), stems base quase silenciosos são
+    descartados antes do NMF/bandas, e componentes/bandas silenciosos logo depois.
+    """
+    branches = []
+    for n in ["vocals","bass"]:
+        if n in base_stems:
+            branches.append(lambda n=n: _base_branch(n, *base_stems[n], gate, metrics))
+
+    if "drums" in base_stems and drum_split:
+        branches.append(lambda: _drum_branch(*base_stems["drums"], drum_crossovers, metrics, gate))
+    elif "drums" in base_stems:
+        branches.append(lambda: _base_branch("drums", *base_stems["drums"], gate, metrics))
+
+    for n in ["piano","guitar","other"]:
+        if n in base_stems:
+            branches.append(lambda n=n: _nmf_branch(n, *base_stems[n], max_extra, sr_target, nmf_opts,
+                                                    stream_over, cache, metrics, gate))
+    return branches
+
+def prepare_stem(stem: Stem, trim: bool = True, normalize: bool = True, metrics=None) -> Stem:
+    """Trim de silêncio e normalização -14 LUFS numa só análise; o ganho é aplicado no próprio array."""
+    from auto.post import trim_and_normalize
+    if trim or normalize:
+        with timed(metrics, "levels"):
+            stem.y = trim_and_normalize(stem.y, stem.sr, trim=trim, normalize=normalize, target_lufs=-14.0)
+    return stem
+
+def tag_stems(stems: List[Stem], metrics=None) -> List[Stem]:
+    """Classifica todos os stems numa única passada em lote do PANNs."""
+    from auto.classify import tag_batch, best_label
+    with timed(metrics, "tag"):
+        try:
+            all_scores = tag_batch([(s.y, s.sr) for s in stems])
+        except Exception:
+            all_scores = [{} for _ in stems]
+    for stem, scores in zip(stems, all_scores):
+        stem.label = best_label(scores)
+        stem.confidence = max(scores.values()) if scores else 0.0
+    return stems
+
+def encode_stem(stem: Stem, folder: str, fmt: str = "mp3", bitrate: int = 320, metrics=None) -> Stem:
+    """Grava o artefato final do stem (mp3, flac, opus ou wav, em processo) e preenche `stem.path`."""
+    from auto.post import AUDIO_FORMATS, encode_audio
+    with timed(metrics, "encode"):
+        stem.path = encode_audio(stem.y, stem.sr, os.path.join(folder, stem.name + AUDIO_FORMATS[fmt]),
+                                 fmt, bitrate)
+    return stem
+
+def report_song(folder: str, song: str, stems: List[Stem], out_html: str, metrics=None, skipped=None) -> str:
+    """Relatório HTML com as formas de onda tiradas da memória.
+
+    Com `metrics`, o relatório inclui a tabela de tempos por estágio e é ele mesmo cronometrado;
+    `skipped` (StemGate.skipped) lista no relatório os stems descartados e o motivo.
+    """
+    from auto.report import build_report
+    with timed(metrics, "report"):
+        return build_report(folder, [s.meta() for s in stems], out_html, song,
+                            audio={s.name: (s.y, s.sr) for s in stems},
+                            metrics=metrics.to_dict() if metrics is not None else None, skipped=skipped)
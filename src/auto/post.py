@@ -1,32 +1,201 @@
 
-import os
+import subprocess
 import numpy as np
-import librosa, soundfile as sf
-from pydub import AudioSegment
-import pyloudnorm as pyln
+import soundfile as sf
+
+# áudio em memória: 1-D (mono) ou (canais, amostras)
 
 def save_wav(path, y, sr):
-    if hasattr(y, "ndim") and y.ndim > 1:
-        y = librosa.to_mono(y)
-    sf.write(path, y, sr, subtype="PCM_16")
+    sf.write(path, y.T if y.ndim > 1 else y, sr, subtype="PCM_16")
 
 def trim_silence(y, sr, top_db=40.0):
+    import librosa
     idx = librosa.effects.split(y, top_db=top_db)
     if len(idx) == 0:
         return y
     start = idx[0, 0]
     end = idx[-1, 1]
-    return y[start:end]
+    return y[..., start:end]
 
 def loudness_normalize(y, sr, target_lufs=-14.0):
+    import pyloudnorm as pyln
     meter = pyln.Meter(sr)
-    loud = meter.integrated_loudness(y.astype(np.float64))
+    loud = meter.integrated_loudness((y.T if y.ndim > 1 else y).astype(np.float64))
     gain = target_lufs - loud
     factor = 10 ** (gain / 20)
     return (y * factor).astype(np.float32)
 
-def export_mp3(wav_path, bitrate=320):
-    audio = AudioSegment.from_file(wav_path)
-    mp3_path = os.path.splitext(wav_path)[0] + ".mp3"
-    audio.export(mp3_path, format="mp3", bitrate=f"{bitrate}k")
-    return mp3_path
+TRIM_FRAME, TRIM_HOP = 2048, 512
+ANALYSIS_BLOCK = 1 << 18
+GATE_BLOCK_S, GATE_STEP = 0.4, 0.25
+CHANNEL_GAINS = [1.0, 1.0, 1.0, 1.41, 1.41]
+
+def _k_weighting_sos(sr):
+    """Filtro K do BS.1770 com os mesmos coeficientes do pyloudnorm, em seções de 2ª ordem."""
+    from pyloudnorm.iirfilter import IIRfilter
+    stages = [IIRfilter(4.0, 1 / np.sqrt(2), 1500.0, sr, "high_shelf"), IIRfilter(0.0, 0.5, 38.0, sr, "high_pass")]
+    return np.array([np.r_[f.passband_gain * f.b / f.a[0], f.a / f.a[0]] for f in stages])
+
+def _gated_loudness(z, channels):
+    """Loudness integrada a partir da energia média (canais, blocos) de cada bloco de gating."""
+    G = np.asarray(CHANNEL_GAINS[:channels])
+    with np.errstate(divide="ignore"):
+        l = -0.691 + 10 * np.log10(G @ z)
+    gated = l >= -70.0
+    if not gated.any():   # silencioso: nada passa do gate absoluto
+        return -np.inf
+    gamma_r = -0.691 + 10 * np.log10(G @ z[:, gated].mean(axis=1)) - 10.0
+    gated = (l > gamma_r) & (l > -70.0)
+    if not gated.any():
+        return -np.inf
+    return float(-0.691 + 10 * np.log10(G @ z[:, gated].mean(axis=1)))
+
+def analyze_levels(y, sr, top_db=40.0, trim=True, loudness=True, block=ANALYSIS_BLOCK):
+    """Limites do trim e loudness integrada numa única passada em blocos (memória limitada a `block`).
+
+    O trim segue o `librosa.effects.split` (RMS em frames de 2048/hop 512, centrados, limiar
+    `top_db` abaixo do frame mais forte, máximo entre canais). A loudness segue o pyloudnorm
+    (filtro K, blocos de 400 ms com 75% de sobreposição, gates absoluto e relativo) sobre o
+    trecho que sobra do trim (ou o sinal inteiro com trim=False). Da passada só ficam as
+    energias por hop (bruta e com filtro K); os blocos de gating são integrados sobre elas,
+    interpolando dentro do hop. Retorna (início, fim, LUFS); LUFS é None abaixo de 400 ms
+    (ou com loudness=False, que pula o filtro K) e -inf se tudo ficar abaixo do gate.
+    """
+    from scipy.signal import sosfilt
+    x = y.reshape(-1, y.shape[-1])
+    C, n = x.shape
+    hop = TRIM_HOP
+    block = max(hop, block - block % hop)
+    nh = -(-n // hop)
+    energy, kenergy = np.zeros((C, nh)), np.zeros((C, nh))
+    sos = _k_weighting_sos(sr)
+    zi = np.zeros((sos.shape[0], C, 2))
+    for c0 in range(0, n, block):
+        seg = x[:, c0:c0 + block].astype(np.float64)
+        m = seg.shape[1]
+        h0, bh = c0 // hop, -(-m // hop)
+        pairs = [(energy, seg)]
+        if loudness:
+            kw, zi = sosfilt(sos, seg, axis=-1, zi=zi)
+            pairs.append((kenergy, kw))
+        for out, sig in pairs:
+            np.square(sig, out=sig)
+            if bh * hop > m:
+                sig = np.pad(sig, ((0, 0), (0, bh * hop - m)))
+            out[:, h0:h0 + bh] = sig.reshape(C, bh, hop).sum(axis=-1)
+
+    F = n // hop + 1
+    E = np.pad(energy, ((0, 0), (2, F + 1 - nh)))
+    mse = (E[:, 0:F] + E[:, 1:F + 1] + E[:, 2:F + 2] + E[:, 3:F + 3]) / TRIM_FRAME
+    db = 10 * np.log10(np.maximum(mse, 1e-10)) - 10 * np.log10(max(float(mse.max()), 1e-10))
+    loud = np.flatnonzero((db > -top_db).any(axis=0))
+    start, end = 0, n
+    if trim and len(loud):
+        start, end = min(int(loud[0]) * hop, n), min((int(loud[-1]) + 1) * hop, n)
+
+    length = end - start
+    if not loudness or length < GATE_BLOCK_S * sr:
+        return start, end, None
+    j = np.arange(int(np.round((length / sr - GATE_BLOCK_S) / (GATE_BLOCK_S * GATE_STEP))) + 1)
+    lo = start + np.minimum((GATE_BLOCK_S * (j * GATE_STEP) * sr).astype(np.int64), length)
+    hi = start + np.minimum((GATE_BLOCK_S * (j * GATE_STEP + 1) * sr).astype(np.int64), length)
+    cum = np.concatenate([np.zeros((C, 1)), np.cumsum(kenergy, axis=1)], axis=1)
+    def prefix(pos):
+        h = np.minimum(pos // hop, nh - 1)
+        width = np.minimum((h + 1) * hop, n) - h * hop
+        return cum[:, h] + kenergy[:, h] * ((pos - h * hop) / width)
+    z = (prefix(hi) - prefix(lo)) / (GATE_BLOCK_S * sr)
+    return start, end, _gated_loudness(z, C)
+
+def trim_and_normalize(y, sr, trim=True, normalize=True, target_lufs=-14.0, top_db=40.0):
+    """Trim + normalização com uma análise só (`analyze_levels`) e o ganho aplicado no lugar.
+
+    O trim é uma view; o ganho multiplica o próprio array quando ele é float32 gravável
+    (senão faz uma única cópia float32). Sinais curtos demais ou silenciosos não recebem ganho.
+    """
+    start, end, lufs = analyze_levels(y, sr, top_db, trim=trim, loudness=normalize)
+    out = y[..., start:end]
+    if normalize and lufs is not None and np.isfinite(lufs):
+        factor = np.float32(10 ** ((target_lufs - lufs) / 20))
+        if out.dtype == np.float32 and out.flags.writeable:
+            out *= factor
+        else:
+            out = np.multiply(out, factor, dtype=np.float32)
+    return out
+
+# formatos de saída; todos saem do libsndfile em processo (MP3/Opus exigem libsndfile >= 1.1)
+AUDIO_FORMATS = {"mp3": ".mp3", "flac": ".flac", "opus": ".opus", "wav": ".wav"}
+OPUS_SR = 48000
+ENCODE_BLOCK = 1 << 16   # quadros por bloco no encode (stems em memmap não voltam inteiros à RAM)
+
+def _mp3_level(sr, kbps):
+    """kbps -> compression_level do libsndfile (CBR: vai linear do bitrate máximo ao mínimo da versão MPEG)."""
+    hi, lo = (320, 32) if sr >= 32000 else (160, 8) if sr >= 16000 else (64, 8)
+    return min(max((hi - kbps) / (hi - lo), 0.0), 0.99)
+
+def _opus_level(kbps, channels):
+    """kbps (total) -> compression_level do libsndfile (256..6 kbps por canal)."""
+    return min(max((256 - kbps / channels) / 250, 0.0), 1.0)
+
+def _pcm_blocks(y, sr, out_sr=None, block=ENCODE_BLOCK):
+    """(quadros, canais) float32 clipado em [-1, 1], bloco a bloco; com `out_sr`, reamostrado
+    em fluxo (soxr, mesmo resampler padrão do librosa)."""
+    stream = None
+    if out_sr and out_sr != sr:
+        import soxr
+        stream = soxr.ResampleStream(sr, out_sr, y.shape[0] if y.ndim > 1 else 1, dtype="float32", quality="HQ")
+    n = y.shape[-1]
+    for i in range(0, n, block):
+        b = y[..., i:i + block]
+        pcm = np.clip(np.ascontiguousarray(b.T if b.ndim > 1 else b, dtype=np.float32), -1.0, 1.0)
+        yield pcm if stream is None else stream.resample_chunk(pcm, last=i + block >= n)
+
+def _write_blocks(path, blocks, sr, channels, **kw):
+    with sf.SoundFile(path, "w", sr, channels, **kw) as f:
+        for pcm in blocks:
+            f.write(pcm)
+    return path
+
+def _ffmpeg_encode(blocks, sr, channels, path, args):
+    cmd = ["ffmpeg", "-y", "-loglevel", "error", "-f", "f32le", "-ar", str(sr), "-ac", str(channels),
+           "-i", "pipe:0", *args, path]
+    proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    try:
+        for pcm in blocks:
+            proc.stdin.write(pcm.astype("<f4", copy=False).tobytes())
+        proc.stdin.close()
+    except BrokenPipeError:
+        pass   # o ffmpeg saiu antes; o erro vem no stderr
+    err = proc.stderr.read()
+    if proc.wait() != 0:
+        raise RuntimeError(err.decode(errors="replace"))
+    return path
+
+def encode_audio(y, sr, path, fmt="mp3", bitrate=320):
+    """Codifica o array direto no formato final, em processo, sem WAV intermediário.
+
+    O libsndfile libera o GIL durante o encode, então vários stems podem ser codificados
+    em paralelo por threads. O array é lido e clipado em blocos de ENCODE_BLOCK quadros (um
+    stem em memmap do NMF em fluxo nunca é copiado inteiro). Se o libsndfile instalado não
+    tiver MP3/Opus, cai no ffmpeg via pipe. Opus é sempre gravado a 48 kHz (reamostra em
+    fluxo se preciso).
+    """
+    if fmt not in AUDIO_FORMATS:
+        raise ValueError(f"formato desconhecido: {fmt}")
+    channels = y.shape[0] if y.ndim > 1 else 1
+    if fmt == "wav":
+        return _write_blocks(path, _pcm_blocks(y, sr), sr, channels, subtype="PCM_16")
+    if fmt == "flac":
+        return _write_blocks(path, _pcm_blocks(y, sr), sr, channels, format="FLAC", subtype="PCM_16")
+    if fmt == "mp3":
+        try:
+            return _write_blocks(path, _pcm_blocks(y, sr), sr, channels, format="MP3",
+                                 compression_level=_mp3_level(sr, bitrate), bitrate_mode="CONSTANT")
+        except (TypeError, ValueError, RuntimeError):
+            return _ffmpeg_encode(_pcm_blocks(y, sr), sr, channels, path, ["-b:a", f"{bitrate}k"])
+    try:
+        return _write_blocks(path, _pcm_blocks(y, sr, OPUS_SR), OPUS_SR, channels, format="OGG",
+                             subtype="OPUS", compression_level=_opus_level(bitrate, channels))
+    except (TypeError, ValueError, RuntimeError):
+        return _ffmpeg_encode(_pcm_blocks(y, sr, OPUS_SR), OPUS_SR, channels, path,
+                              ["-c:a", "libopus", "-b:a", f"{bitrate}k"])
@@ -1,6 +1,8 @@
 
-import os, base64, io, soundfile as sf
-import matplotlib.pyplot as plt
+import os
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import soundfile as sf
 from jinja2 import Template
 
 TEMPLATE = '''<!DOCTYPE html>
@@ -16,8 +18,12 @@ h2{margin:24px 0 8px}
 .grid{display:grid; grid-template-columns:1fr; gap:18px;}
 .card{border:1px solid #e5e7eb; border-radius:10px; padding:16px; box-shadow:0 4px 20px rgba(2,6,23,.04)}
 .meta{font-size:14px; color:#475569}
-img{max-width:100%; height:auto; border-radius:10px; border:1px solid #e5e7eb}
+.wave{display:block; width:100%; height:100px; border-radius:10px; border:1px solid #e5e7eb; background:#f8fafc}
+.wave polygon{fill:#1f77b4}
 code{background:#f8fafc; padding:2px 6px; border-radius:6px; font-family:ui-monospace, SFMono-Regular, Menlo, Consolas, monospace}
+table{border-collapse:collapse; font-size:14px}
+td,th{border-bottom:1px solid #e5e7eb; padding:4px 12px; text-align:right}
+td:first-child,th:first-child{text-align:left}
 .badge{display:inline-block; padding:2px 8px; border-radius:999px; background:#eef2ff; color:#3730a3; font-size:12px}
 </style>
 </head>
@@ -30,47 +36,106 @@ code{background:#f8fafc; padding:2px 6px; border-radius:6px; font-family:ui-mono
   <div class="card">
     <div class="badge">{{ stem.name }}</div>
     <p class="meta">{{ stem.path }}</p>
-    <p class="meta">Provável: <strong>{{ stem.label }}</strong> — conf.: {{ "%.2f"|format(stem.confidence) }}</p>
-    <img src="data:image/png;base64,{{ stem.wave }}" alt="waveform {{ stem.name }}"/>
+    <p class="meta">Provável: <strong>{{ stem.label }}</strong> — conf.: {{ "%.2f"|format(stem.confidence) }}{% if stem.peak_db is not none %} — pico: {{ "%.1f"|format(stem.peak_db) }} dBFS{% endif %}</p>
+    {{ stem.wave }}
   </div>
 {% endfor %}
 </div>
+{% if skipped %}
+<h2>Stems descartados ({{ skipped|length }})</h2>
+<table>
+<tr><th>Stem</th><th>Etapa</th><th>Motivo</th></tr>
+{% for s in skipped %}
+<tr><td>{{ s.name }}</td><td>{{ s.stage }}</td><td style="text-align:left">{{ s.reason }}</td></tr>
+{% endfor %}
+</table>
+{% endif %}
+{% if metrics %}
+<h2>Desempenho</h2>
+<table>
+<tr><th>Estágio</th><th>Parede (s)</th><th>CPU (s)</th><th>Soma dos workers (s)</th><th>Pico RSS (MB)</th></tr>
+{% for name, st in metrics.stages.items() %}
+<tr><td>{{ name }}</td><td>{{ "%.2f"|format(st.wall_s) }}</td><td>{{ "%.2f"|format(st.cpu_s) }}</td><td>{{ "%.2f"|format(st.busy_s) }}</td><td>{{ "%.0f"|format(st.peak_rss_mb) }}</td></tr>
+{% endfor %}
+<tr><th>música (início → relatório)</th><th>{{ "%.2f"|format(metrics.total_s) }}</th><th></th><th></th><th>{{ "%.0f"|format(metrics.peak_rss_mb) }}</th></tr>
+</table>
+{% endif %}
 </body>
 </html>'''
 
-def _png_bytes(fig):
-    bio = io.BytesIO()
-    fig.savefig(bio, format="png", bbox_inches="tight", dpi=160)
-    import matplotlib.pyplot as plt
-    plt.close(fig)
-    bio.seek(0)
-    return base64.b64encode(bio.read()).decode("ascii")
+ENVELOPE_BINS = 800
+
+def peak_envelope(y, bins=ENVELOPE_BINS):
+    """Envelope min/max em `bins` colunas, numa passada vetorizada (todos os canais juntos).
+
+    As colunas cheias são uma view (reshape) do sinal e a última, incompleta, é tratada à
+    parte: nada do tamanho do stem é copiado (importante para os memmaps do NMF em fluxo).
+    """
+    y = np.asarray(y, dtype=np.float32)
+    y = y.reshape(-1, y.shape[-1])
+    n = y.shape[-1]
+    if n == 0:
+        return np.zeros(0, np.float32), np.zeros(0, np.float32)
+    bins = min(bins, n)
+    step = -(-n // bins)
+    full = n // step
+    blocks = y[:, :full * step].reshape(y.shape[0], full, step)
+    lo, hi = blocks.min(axis=(0, 2)), blocks.max(axis=(0, 2))
+    if full * step < n:
+        tail = y[:, full * step:]
+        lo, hi = np.append(lo, tail.min()), np.append(hi, tail.max())
+    return lo, hi
+
+def file_envelope(path, bins=ENVELOPE_BINS):
+    """Mesmo envelope lido do arquivo em blocos alinhados às colunas (sem carregar o áudio inteiro)."""
+    step = max(1, -(-sf.info(path).frames // bins))
+    lo, hi = [], []
+    for block in sf.blocks(path, blocksize=step * max(1, (1 << 18) // step), always_2d=True, dtype="float32"):
+        l, h = peak_envelope(block.T, bins=-(-block.shape[0] // step))
+        lo.append(l); hi.append(h)
+    return np.concatenate(lo), np.concatenate(hi)
+
+def envelope_svg(lo, hi, height=100):
+    """Polígono SVG inline do envelope (poucos KB por stem, escala automática como antes)."""
+    n = len(hi)
+    if n == 0:
+        return ""
+    scale = max(float(np.abs(lo).max()), float(np.abs(hi).max()), 1e-9)
+    mid = height / 2
+    xs = np.r_[np.arange(n), np.arange(n)[::-1]]
+    ys = np.rint(mid - np.r_[hi, lo[::-1]] / scale * (mid - 1)).astype(int)
+    pts = " ".join(f"{x},{y}" for x, y in zip(xs, ys))
+    return (f'<svg class="wave" viewBox="0 0 {n} {height}" preserveAspectRatio="none">'
+            f'<polygon points="{pts}"/></svg>')
 
-def _waveform_png(path):
-    data, sr = sf.read(path, always_2d=True)
-    y = data.mean(axis=1)
-    import matplotlib.pyplot as plt
-    fig = plt.figure()
-    ax = fig.add_subplot(111)
-    ax.set_title(os.path.basename(path))
-    ax.plot(y)
-    return _png_bytes(fig)
+def _waveform(path, y=None):
+    """(svg, pico em dBFS) do stem: do array em memória quando houver, senão do arquivo."""
+    lo, hi = peak_envelope(y) if y is not None else file_envelope(path)
+    peak = max(float(np.abs(lo).max()), float(np.abs(hi).max())) if len(hi) else 0.0
+    return envelope_svg(lo, hi), 20 * np.log10(max(peak, 1e-9))
 
-def build_report(song_folder, stems_meta, out_html, title):
-    stems = []
-    for m in stems_meta:
+def build_report(song_folder, stems_meta, out_html, title, audio=None, metrics=None, workers=0, skipped=None):
+    """`audio` opcional: {nome: (y, sr)} já em memória, evita decodificar os arquivos finais de novo.
+    `metrics` opcional (SongMetrics.to_dict()) vira a tabela de desempenho por estágio e
+    `skipped` ({name, stage, reason} do StemGate) a lista de stems descartados por silêncio.
+    Os envelopes dos stems são calculados em paralelo (`workers`, 0 = nº de núcleos)."""
+    def _stem(m):
         try:
-            png = _waveform_png(m["path"])
+            svg, peak = _waveform(m["path"], (audio or {}).get(m["name"], (None,))[0])
         except Exception:
-            png = ""
-        stems.append({
+            svg, peak = "", None
+        return {
             "name": m["name"],
             "path": m["path"],
             "label": m["label"],
             "confidence": m.get("confidence", 0.0),
-            "wave": png
-        })
-    html = Template(TEMPLATE).render(title=title, song_folder=song_folder, stems=stems)
+            "wave": svg,
+            "peak_db": peak
+        }
+    with ThreadPoolExecutor(max_workers=workers if workers > 0 else (os.cpu_count() or 1)) as pool:
+        stems = list(pool.map(_stem, stems_meta))
+    html = Template(TEMPLATE).render(title=title, song_folder=song_folder, stems=stems, metrics=metrics,
+                                     skipped=skipped)
     with open(out_html, "w", encoding="utf-8") as f:
         f.write(html)
     return out_html
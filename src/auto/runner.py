@@ -0,0 +1,192 @@
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Iterable, List, Optional
+
+from auto.batch import run_stages
+from auto.crossover import DRUM_CROSSOVERS
+from auto.gate import GATE_ACTIVITY, GATE_DB, StemGate
+from auto.engine import separate_base
+from auto.metrics import SongMetrics
+from auto.pipeline import (Stem, default_workers, encode_stem, prepare_stem, report_song,
+                           stem_branches, tag_stems)
+from auto.utils import ZipAppender, basename_noext
+
+class SongRun:
+    """Estado de uma música ao longo do pipeline (pasta, stems base/finais/descartados, ZIP, métricas)."""
+
+    def __init__(self, input_path: Optional[str], song: str):
+        self.input_path, self.song = input_path, song
+        self.folder = None
+        self.base_stems = None
+        self.stems: List[Stem] = []
+        self.skipped: List[dict] = []
+        self.zip_path = None
+        self.report_path = None
+        self.metrics = SongMetrics(song)
+        self._zip = None
+
+class Pipeline:
+    """Orquestrador único usado pelo CLI, pela API e pela Web UI.
+
+    Grafo por música: Demucs → ramos independentes {vocals, bass, bateria/bandas, NMF de
+    cada residual} → trim/LUFS de cada stem assim que o ramo dele termina → classificação
+    em lote → encode → relatório/ZIP. Os ramos e o pós de cada stem rodam em paralelo num
+    pool de `workers` threads (o encode também: o libsndfile libera o GIL). `fmt` (mp3,
+    flac, opus ou wav) tem precedência sobre `mp3`; `drum_crossovers` são as frequências de
+    corte (Hz) das bandas da bateria com `drum_split`. Com `gate`, stems e componentes com
+    menos de `gate_activity` do tempo acima de `gate_db` dBFS são descartados antes do NMF,
+    do pós e do encode (ficam em `SongRun.skipped` e no relatório). `demucs_jobs` > 1 (CPU)
+    divide o Demucs de cada música em segmentos num pool de processos. Os recursos quentes
+    (engine Demucs, tagger PANNs, cache) são por processo e compartilhados por todas as
+    instâncias.
+    """
+
+    def __init__(self, out_dir: str = "outputs", device: str = "cpu", model: str = "htdemucs",
+                 shifts: int = 0, overlap: float = 0.25, in_process: bool = True, mono: bool = False,
+                 drum_split: bool = False, max_extra: int = 6, sr_target=None, nmf_opts: dict = None,
+                 stream_over: float = 600.0, trim: bool = True, normalize: bool = True,
+                 mp3: bool = True, bitrate: int = 320, report: bool = True,
+                 reports_dir: str = "reports", zip: bool = True, workers: int = 0, cache=None,
+                 fmt: Optional[str] = None, drum_crossovers=DRUM_CROSSOVERS, gate: bool = True,
+                 gate_db: float = GATE_DB, gate_activity: float = GATE_ACTIVITY, demucs_jobs: int = 1):
+        self.out_dir, self.device, self.model = out_dir, device, model
+        self.shifts, self.overlap, self.in_process, self.mono = shifts, overlap, in_process, mono
+        self.drum_split, self.max_extra, self.sr_target = drum_split, max_extra, sr_target
+        self.drum_crossovers = drum_crossovers
+        self.gate, self.gate_db, self.gate_activity = gate, gate_db, gate_activity
+        self.demucs_jobs = demucs_jobs
+        self.nmf_opts, self.stream_over = nmf_opts or {}, stream_over
+        self.trim, self.normalize, self.bitrate = trim, normalize, bitrate
+        self.fmt = fmt or ("mp3" if mp3 else "wav")
+        self.report, self.reports_dir, self.zip = report, reports_dir, zip
+        self.workers, self.cache = workers, cache
+
+    def separate(self, run: SongRun) -> SongRun:
+        """Demucs (ou cache) → run.folder e run.base_stems."""
+        with run.metrics.stage("demucs"):
+            run.folder, run.base_stems = separate_base(
+                run.input_path, out_dir=self.out_dir, song=run.song, device=self.device, model=self.model,
+                shifts=self.shifts, overlap=self.overlap, in_process=self.in_process, cache=self.cache,
+                mono=self.mono, jobs=self.demucs_jobs)
+        return run
+
+    def stems(self, run: SongRun, on_stem: Optional[Callable[[Stem], None]] = None) -> SongRun:
+        """Ramos de separação + pós-processamento até os arquivos finais (run.stems, em ordem).
+
+        `on_stem(stem)` é chamado assim que o arquivo de cada stem fica pronto; com zip=True
+        o stem também entra no ZIP da música nesse momento.
+        """
+        os.makedirs(run.folder, exist_ok=True)
+        if self.zip:
+            run.zip_path = os.path.join(self.out_dir, f"{run.song}-autostems.zip")
+            run._zip = ZipAppender(run.zip_path, os.path.dirname(run.folder))
+        m = run.metrics
+        gate = StemGate(self.gate_db, self.gate_activity) if self.gate else None
+        run.skipped = gate.skipped if gate is not None else []
+        branches = stem_branches(run.base_stems, self.drum_split, self.max_extra, self.sr_target,
+                                 self.nmf_opts, self.stream_over, self.cache, m,
+                                 self.drum_crossovers, gate)
+
+        def _encode(stem):
+            encode_stem(stem, run.folder, self.fmt, self.bitrate, m)
+            if run._zip is not None:
+                run._zip.add(stem.path)
+            if on_stem is not None:
+                on_stem(stem)
+
+        try:
+            with ThreadPoolExecutor(max_workers=default_workers(self.workers)) as pool:
+                outputs = [None] * len(branches)
+                futures = {pool.submit(fn): i for i, fn in enumerate(branches)}
+                prepared = []
+                for fut in as_completed(futures):
+                    outputs[futures[fut]] = stems = fut.result()
+                    prepared += [pool.submit(prepare_stem, s, self.trim, self.normalize, m) for s in stems]
+                for fut in prepared:
+                    fut.result()
+                run.stems = [s for stems in outputs for s in stems]
+                run.base_stems = None
+                tag_stems(run.stems, m)
+                list(pool.map(_encode, run.stems))
+        except BaseException:
+            if run._zip is not None:
+                run._zip.close()
+            raise
+        return run
+
+    def package(self, run: SongRun) -> SongRun:
+        """Relatório HTML e fechamento do ZIP (com o que restar na pasta, ex.: o relatório)."""
+        try:
+            if self.report:
+                os.makedirs(self.reports_dir, exist_ok=True)
+                run.report_path = report_song(run.folder, run.song, run.stems,
+                                              os.path.join(self.reports_dir, f"{run.song}.html"),
+                                              metrics=run.metrics, skipped=run.skipped)
+            if run._zip is not None:
+                with run.metrics.stage("zip"):
+                    run._zip.add_dir(run.folder)
+        finally:
+            if run._zip is not None:
+                run._zip.close()
+                run._zip = None
+            run.metrics.finish()
+        return run
+
+    def run(self, input_path: Optional[str], song: Optional[str] = None, base_stems: dict = None,
+            on_stem: Optional[Callable[[Stem], None]] = None,
+            progress: Optional[Callable[[str, float], None]] = None) -> SongRun:
+        """Uma música do início ao fim. `base_stems` pula o Demucs (stems já separados).
+
+        `progress(estágio, fração)` é chamado entre os estágios (e pode levantar exceção para
+        cancelar, como faz a fila de jobs da API).
+        """
+        run = SongRun(input_path, song or basename_noext(input_path))
+        progress = progress or (lambda stage, frac: None)
+        if base_stems is None:
+            progress("demucs", 0.05)
+            self.separate(run)
+        else:
+            run.folder, run.base_stems = os.path.join(self.out_dir, self.model, run.song), base_stems
+        progress("stems", 0.4)
+        self.stems(run, on_stem=on_stem)
+        progress("package", 0.9)
+        return self.package(run)
+
+    def run_many(self, inputs: Iterable[str], jobs: int = 1, package_jobs: int = 1, queue_size: int = 2):
+        """Várias músicas em estágios encadeados (Demucs → stems → pacote) com back-pressure.
+
+        Gera (entrada, SongRun, erro) na ordem de conclusão, como `run_stages`.
+        """
+        stages = [("demucs", lambda f: self.separate(SongRun(f, basename_noext(f))), 1),
+                  ("stems", self.stems, jobs),
+                  ("package", self.package, package_jobs)]
+        return run_stages(inputs, stages, queue_size=queue_size)
+
+def warmup(models=("htdemucs",), device: str = "cpu", tagger: bool = True, demucs_jobs: int = 1) -> dict:
+    """Pré-carrega explicitamente o que o pipeline importa/carrega sob demanda.
+
+    Importa os módulos pesados, carrega o engine Demucs de cada modelo (e, com
+    demucs_jobs > 1 em CPU, sobe o pool de processos de segmentos) e o tagger PANNs
+    (com uma inferência curta). Devolve o tempo de cada etapa em segundos.
+    """
+    import time
+    times = {}
+    t0 = time.perf_counter()
+    import auto.nmf_split, auto.post, auto.report, auto.classify  # noqa: F401
+    times["imports"] = time.perf_counter() - t0
+    from auto.engine import get_engine, warm_segment_pool
+    for model in models:
+        t0 = time.perf_counter()
+        get_engine(model, device)
+        times[f"demucs:{model}"] = time.perf_counter() - t0
+        if demucs_jobs > 1 and device == "cpu":
+            t0 = time.perf_counter()
+            warm_segment_pool(model, demucs_jobs)
+            times[f"demucs:{model}x{demucs_jobs}"] = time.perf_counter() - t0
+    if tagger:
+        import numpy as np
+        from auto.classify import tag_batch
+        t0 = time.perf_counter()
+        tag_batch([(np.zeros(32000, dtype=np.float32), 32000)], device=device)
+        times["panns"] = time.perf_counter() - t0
+    return times
@@ -1,7 +1,6 @@
 
-import os, zipfile, pathlib, shutil
-from typing import List, Tuple
-import numpy as np
+import io, os, re, zipfile, pathlib, shutil, threading
+from typing import Iterable, Iterator, List, Tuple
 
 AUDIO_EXTS = {".mp3", ".wav", ".flac", ".ogg", ".m4a", ".aac"}
 
@@ -23,14 +22,97 @@ def scan_inputs(path: str) -> List[str]:
 def basename_noext(path: str) -> str:
     return pathlib.Path(path).stem
 
-def zip_dir(folder: str, out_zip: str) -> str:
-    with zipfile.ZipFile(out_zip, "w", zipfile.ZIP_DEFLATED) as z:
+def upload_name(filename: str):
+    """(nome da música, extensão) de um nome de arquivo enviado pelo cliente.
+
+    Só o último componente é usado (separadores / e \\ e `..` não atravessam diretórios) e
+    caracteres de controle/aspas viram "_", já que o nome entra em caminhos de saída e no
+    Content-Disposition.
+    """
+    base = re.split(r"[\\/]", filename or "")[-1]
+    stem, ext = os.path.splitext(base)
+    stem = re.sub(r'[\x00-\x1f"<>:|?*]', "_", stem).strip(" .")
+    return stem or "audio", ext if re.fullmatch(r"\.\w+", ext) else ""
+
+# formatos já comprimidos: deflate gasta CPU sem ganho de tamanho
+STORED_EXTS = {".mp3", ".flac", ".ogg", ".opus", ".m4a", ".aac", ".zip", ".png", ".jpg"}
+
+def zip_compression(path: str) -> int:
+    return zipfile.ZIP_STORED if pathlib.Path(path).suffix.lower() in STORED_EXTS else zipfile.ZIP_DEFLATED
+
+class ZipAppender:
+    """ZIP montado aos poucos: cada arquivo entra assim que fica pronto (seguro entre threads).
+
+    Nomes no zip são relativos a `base_dir`; arquivos já adicionados são ignorados.
+    """
+
+    def __init__(self, out_zip: str, base_dir: str):
+        self.path, self.base_dir = out_zip, base_dir
+        self.z = zipfile.ZipFile(out_zip, "w", zipfile.ZIP_DEFLATED)
+        self.added = set()
+        self.lock = threading.Lock()
+
+    def add(self, path: str):
+        rel = os.path.relpath(path, start=self.base_dir)
+        with self.lock:
+            if rel in self.added:
+                return
+            self.z.write(path, arcname=rel, compress_type=zip_compression(path))
+            self.added.add(rel)
+
+    def add_dir(self, folder: str):
         for root, _, files in os.walk(folder):
-            for f in files:
-                full = os.path.join(root, f)
-                rel = os.path.relpath(full, start=os.path.dirname(folder))
-                z.write(full, arcname=rel)
-    return out_zip
+            for f in sorted(files):
+                self.add(os.path.join(root, f))
+
+    def close(self) -> str:
+        self.z.close()
+        return self.path
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class _ZipSink(io.RawIOBase):
+    """Destino não-seekable para zipfile: acumula bytes até serem consumidos por pop()."""
+
+    def __init__(self):
+        self.buf = bytearray()
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self.buf += b
+        return len(b)
+
+    def pop(self) -> bytes:
+        out = bytes(self.buf)
+        self.buf.clear()
+        return out
+
+def zip_stream(entries: Iterable[Tuple[str, str]], chunk: int = 1 << 20) -> Iterator[bytes]:
+    """Gera um ZIP em pedaços a partir de (caminho, nome no zip), sem montar o arquivo em disco.
+
+    `entries` pode ser um gerador que só produz o próximo arquivo quando ele existe; os bytes
+    de cada membro saem enquanto ele é lido.
+    """
+    sink = _ZipSink()
+    with zipfile.ZipFile(sink, "w", zipfile.ZIP_DEFLATED) as z:
+        for path, arcname in entries:
+            info = zipfile.ZipInfo.from_file(path, arcname)
+            info.compress_type = zip_compression(path)
+            with open(path, "rb") as src, z.open(info, "w", force_zip64=True) as dst:
+                while True:
+                    data = src.read(chunk)
+                    if not data:
+                        break
+                    dst.write(data)
+                    if sink.buf: yield sink.pop()
+            if sink.buf: yield sink.pop()
+    yield sink.pop()
 
 def detect_device(force_gpu: bool) -> str:
     try:
@@ -41,17 +123,3 @@ def detect_device(force_gpu: bool) -> str:
         return "cuda" if torch.cuda.is_available() else "cpu"
     except Exception:
         return "cpu"
-
-def band_split(y: np.ndarray, sr: int, low_hz=160, high_hz=6000):
-    \"\"\"3 bandas: low (<low_hz), mid (low_hz..high_hz), high (>high_hz) via FFT mask simples.\"\"\"
-    import numpy as np
-    Y = np.fft.rfft(y, axis=-1)
-    freqs = np.fft.rfftfreq(y.shape[-1], 1/sr)
-    low_mask = freqs < low_hz
-    high_mask = freqs > high_hz
-    mid_mask = ~(low_mask | high_mask)
-    def recon(mask):
-        Ym = Y * mask
-        ym = np.fft.irfft(Ym, axis=-1).astype(np.float32)
-        return ym
-    return recon(low_mask), recon(mid_mask), recon(high_mask)
@@ -1,15 +1,13 @@
 
-import os, pathlib, typer
+import os, pathlib, time, typer
 from typing import Optional, List
 from rich.console import Console
-from rich.progress import track
 
-from auto.utils import ensure_dir, scan_inputs, basename_noext, detect_device, zip_dir, band_split
-from auto.engine import run_demucs, find_output_folder
-from auto.nmf_split import split_file_nmf
-from auto.classify import tag_wav, best_label
-from auto.post import trim_silence, loudness_normalize, save_wav, export_mp3
-from auto.report import build_report
+from auto.utils import ensure_dir, scan_inputs, detect_device
+from auto.metrics import aggregate, write_json
+
+# o pipeline (numpy/librosa/torch...) é importado dentro de cada comando: `--help`, `serve`
+# e `webui` não pagam esse custo
 
 app = typer.Typer(add_completion=False)
 console = Console()
@@ -18,8 +16,9 @@ console = Console()
 def separate(path: str = typer.Argument(..., help="Arquivo ou pasta"),
              out: str = typer.Option("outputs", "--out", "-o"),
              base_model: str = typer.Option("htdemucs", help="Modelo Demucs base: htdemucs (4) ou htdemucs_6s (6)"),
-             mp3: bool = typer.Option(True, help="Exportar MP3"),
-             bitrate: int = typer.Option(320, help="Bitrate MP3"),
+             mp3: bool = typer.Option(True, help="Exportar MP3 (--no-mp3 = WAV)"),
+             fmt: Optional[str] = typer.Option(None, "--format", help="Formato de saída: mp3, flac, opus ou wav (prevalece sobre --mp3)"),
+             bitrate: int = typer.Option(320, help="Bitrate MP3/Opus (kbps)"),
              gpu: bool = typer.Option(False, help="Tentar GPU"),
              shifts: int = typer.Option(0, help="Shifts Demucs"),
              overlap: float = typer.Option(0.25, help="Overlap Demucs"),
@@ -27,88 +26,155 @@ def separate(path: str = typer.Argument(..., help="Arquivo ou pasta"),
              trim: bool = typer.Option(True, help="Remover silêncio"),
              sr: Optional[int] = typer.Option(None, help="Reamostrar para SR"),
              max_extra: int = typer.Option(6, help="Máximo de componentes adicionais (Auto‑K)"),
+             nmf_search: str = typer.Option("linear", help="Busca do K: linear (para no joelho) ou bisect"),
+             nmf_res: str = typer.Option("full", help="Resolução da fatoração NMF: full, high, medium ou low"),
+             nmf_stream_over: float = typer.Option(600.0, help="NMF em blocos (memória limitada) para residuais acima de N segundos; 0 desliga"),
+             nmf_warm_start: bool = typer.Option(False, help="Warm start de cada k a partir de k-1 (mais rápido, K pode mudar)"),
+             nmf_backend: str = typer.Option("sklearn", help="Backend do NMF: sklearn (referência) ou mu (float32, NumPy)"),
+             nmf_beta: str = typer.Option("frobenius", help="Divergência do NMF: frobenius, kl ou is"),
+             nmf_shared_init: bool = typer.Option(False, help="Uma só SVD de inicialização para todos os k do Auto‑K"),
              drum_split: bool = typer.Option(False, help="Dividir drums em bandas low/mid/high"),
-             report: bool = typer.Option(True, help="Gerar relatório HTML")):
+             drum_crossovers: str = typer.Option("160,6000", help="Frequências de corte (Hz) das bandas da bateria, separadas por vírgula (N cortes = N+1 bandas)"),
+             gate: bool = typer.Option(True, help="Descartar stems/componentes quase silenciosos antes do NMF/pós/encode"),
+             gate_db: float = typer.Option(-60.0, help="RMS (dBFS) a partir do qual um trecho conta como ativo"),
+             gate_activity: float = typer.Option(0.01, help="Fração mínima do tempo ativa para manter um stem"),
+             mono: bool = typer.Option(False, "--mono/--stereo", help="Stems mono (mixdown) ou com os canais do Demucs"),
+             in_process: bool = typer.Option(True, "--in-process/--subprocess", help="Demucs residente em memória (ou subprocesso por música)"),
+             demucs_jobs: int = typer.Option(1, help="Processos do Demucs por música em CPU (segmentos em paralelo; 1 = desliga)"),
+             workers: int = typer.Option(0, help="Workers do pós-processamento (0 = nº de núcleos)"),
+             nmf_jobs: int = typer.Option(1, help="Músicas simultâneas no estágio de stems (NMF + pós)"),
+             post_jobs: int = typer.Option(1, help="Músicas simultâneas no relatório/ZIP"),
+             queue_size: int = typer.Option(2, help="Músicas em espera entre estágios (limita memória)"),
+             cache_dir: str = typer.Option("cache", help="Cache de stems Demucs/NMF (reuso entre execuções)"),
+             cache_gb: float = typer.Option(20.0, help="Tamanho máximo do cache (GB, LRU)"),
+             no_cache: bool = typer.Option(False, "--no-cache", help="Não usar o cache"),
+             report: bool = typer.Option(True, help="Gerar relatório HTML"),
+             metrics_json: Optional[str] = typer.Option(None, help="Grava tempos/CPU/RSS por estágio e música neste JSON")):
+    from auto.cache import StemCache
+    from auto.runner import Pipeline
+    from auto.post import AUDIO_FORMATS
+    from auto.crossover import parse_crossovers
+    if fmt and fmt not in AUDIO_FORMATS:
+        raise typer.BadParameter(f"--format deve ser um de: {', '.join(AUDIO_FORMATS)}")
+    try:
+        crossovers = parse_crossovers(drum_crossovers)
+    except ValueError as e:
+        raise typer.BadParameter(f"--drum-crossovers: {e}")
     files = scan_inputs(path)
     if not files: raise typer.BadParameter("Nenhum arquivo encontrado.")
     ensure_dir(out); ensure_dir("reports")
 
     device = detect_device(gpu)
+    cache = None if no_cache else StemCache(cache_dir, int(cache_gb * 2**30))
+    nmf_opts = {"strategy": nmf_search, "warm_start": nmf_warm_start, "resolution": nmf_res,
+                "backend": nmf_backend, "beta": nmf_beta, "shared_init": nmf_shared_init}
     console.rule(f"[bold]Processando {len(files)} arquivo(s) | device={device} | modelo={base_model}")
 
-    for f in track(files, description="Separando"):
-        stem_base = basename_noext(f)
-        run_demucs(f, out_dir=out, device=device, model=base_model, shifts=shifts, overlap=overlap, mp3=False)
-        folder = find_output_folder(out, base_model, stem_base)
-
-        stems_meta = []
-
-        def _finalize(name, y, sr0):
-            if trim: y = trim_silence(y, sr0)
-            if normalize: y = loudness_normalize(y, sr0, -14.0)
-            wav_path = os.path.join(folder, f"{name}.wav")
-            save_wav(wav_path, y, sr0)
-            try:
-                scores = tag_wav(wav_path)
-                label = best_label(scores)
-                conf = max(scores.values()) if scores else 0.0
-            except Exception:
-                label = "desconhecido"; conf = 0.0
-            final_path = wav_path
-            if mp3:
-                final_path = export_mp3(wav_path, bitrate=bitrate)
-                try: os.remove(wav_path)
-                except: pass
-            stems_meta.append({"name": name, "path": final_path, "label": label, "confidence": conf})
-
-        import soundfile as sf, glob, numpy as np
-        def _load(path):
-            try:
-                y, sr0 = sf.read(path, always_2d=False)
-                if hasattr(y, "ndim") and y.ndim > 1: y = y.mean(axis=1)
-                return y, sr0
-            except Exception:
-                return None, None
-
-        base_stems = {}
-        for name in ["vocals","drums","bass","other","piano","guitar"]:
-            cand = glob.glob(os.path.join(folder, f"{name}.*"))
-            if cand:
-                y, sr0 = _load(cand[0])
-                if y is not None: base_stems[name] = (y, sr0)
-
-        for n in ["vocals","bass"]:
-            if n in base_stems:
-                _finalize(n, base_stems[n][0], base_stems[n][1])
-
-        if "drums" in base_stems and drum_split:
-            y, sr0 = base_stems["drums"]
-            low, mid, high = band_split(y, sr0)
-            _finalize("drums_low", low, sr0)
-            _finalize("drums_mid", mid, sr0)
-            _finalize("drums_high", high, sr0)
-        elif "drums" in base_stems:
-            _finalize("drums", base_stems["drums"][0], base_stems["drums"][1])
-
-        for n in ["piano","guitar","other"]:
-            target = os.path.join(folder, f"{n}.wav")
-            if n in base_stems and os.path.exists(target):
-                comps, sr1, k, errs = split_file_nmf(target, max_k=max_extra, sr_target=sr)
-                for i, yi in enumerate(comps, start=1):
-                    _finalize(f"{n}_comp{i}", yi, sr1)
-
-        if report:
-            html = os.path.join("reports", f"{stem_base}.html")
-            build_report(folder, stems_meta, html, stem_base)
-        zip_path = os.path.join(out, f"{stem_base}-autostems.zip")
-        zip_dir(folder, zip_path)
-        console.print(f"[green]OK:[/green] {zip_path}")
-
+    pipeline = Pipeline(out_dir=out, device=device, model=base_model, shifts=shifts, overlap=overlap,
+                        in_process=in_process, mono=mono, drum_split=drum_split, drum_crossovers=crossovers,
+                        gate=gate, gate_db=gate_db, gate_activity=gate_activity, demucs_jobs=demucs_jobs,
+                        max_extra=max_extra, sr_target=sr, nmf_opts=nmf_opts, stream_over=nmf_stream_over, trim=trim,
+                        normalize=normalize, mp3=mp3, fmt=fmt, bitrate=bitrate, report=report, workers=workers,
+                        cache=cache)
+    t0 = time.perf_counter(); ok = 0; runs = []
+    results = pipeline.run_many(files, jobs=nmf_jobs, package_jobs=post_jobs, queue_size=queue_size)
+    for i, (f, run, err) in enumerate(results, start=1):
+        if err:
+            console.print(f"[red]ERRO ({err[0]}):[/red] {f}: {err[1]}")
+        else:
+            ok += 1
+            runs.append(run.metrics.to_dict())
+            console.print(f"[green]OK {i}/{len(files)}:[/green] {run.zip_path}")
+            console.print(f"  [dim]{run.metrics.summary()}[/dim]")
+            for s in run.skipped:
+                console.print(f"  [yellow]descartado[/yellow] {s['name']} ({s['stage']}): {s['reason']}")
+
+    hours = (time.perf_counter() - t0) / 3600
+    console.print(f"{ok}/{len(files)} música(s) | {ok / max(hours, 1e-9):.1f} músicas/h")
+    if cache is not None:
+        st = cache.stats()
+        console.print(f"cache: hits={st['hits']} misses={st['misses']} | {st['bytes'] / 2**30:.2f} GB")
+    if metrics_json:
+        write_json(metrics_json, {"songs": runs, "stages": aggregate(runs)})
+        console.print(f"métricas: {metrics_json}")
     console.rule("[bold green]Concluído")
 
+@app.command("bench-nmf")
+def bench_nmf(seconds: float = typer.Option(30.0, help="Duração da mistura sintética"),
+              max_extra: int = typer.Option(6, help="Máximo de componentes (Auto‑K)"),
+              backends: bool = typer.Option(False, help="Compara backends/divergências em vez de resoluções")):
+    """Compara tempo e SDR do NMF em cada resolução (full/high/medium/low) ou backend."""
+    from auto.bench import bench_nmf_resolution, bench_nmf_backends
+    if backends:
+        for row in bench_nmf_backends(seconds=seconds, max_k=max_extra):
+            name = f"{row['backend']}/{row.get('beta', 'frobenius')}" + ("+svd" if row.get("shared_init") else "")
+            console.print(f"{name:>18} | {row['seconds']:7.2f}s | K={row['k']} | SDR {row['sdr_db']:6.2f} dB")
+        return
+    for row in bench_nmf_resolution(seconds=seconds, max_k=max_extra):
+        console.print(f"{row['resolution']:>6} | {row['seconds']:7.2f}s | K={row['k']} | SDR {row['sdr_db']:6.2f} dB")
+
+@app.command("bench-pipeline")
+def bench_pipeline(inputs: Optional[List[str]] = typer.Argument(None, help="Áudios reais (roda o Demucs); vazio = stems sintéticos"),
+                   songs: int = typer.Option(2, help="Músicas sintéticas"),
+                   seconds: float = typer.Option(30.0, help="Duração de cada música sintética"),
+                   out: str = typer.Option("bench", "--out", "-o"),
+                   json_path: str = typer.Option("bench.json", "--json", help="Resultado em JSON (para comparar versões)"),
+                   fmt: str = typer.Option("mp3", "--format", help="Formato de saída: mp3, flac, opus ou wav"),
+                   max_extra: int = typer.Option(6, help="Máximo de componentes (Auto‑K)"),
+                   gpu: bool = typer.Option(False, help="Tentar GPU")):
+    """Benchmark ponta a ponta: tempo de parede, CPU e pico de RSS por estágio."""
+    from auto.bench import bench_pipeline as _bench
+    ensure_dir(out)
+    res = _bench(out_dir=out, songs=songs, seconds=seconds, inputs=inputs or None, fmt=fmt,
+                 max_extra=max_extra, device=detect_device(gpu))
+    for name, st in res["stages"].items():
+        console.print(f"{name:>10} | {st['mean_wall_s']:7.2f}s/música | CPU {st['cpu_s']:7.2f}s | "
+                      f"workers {st['busy_s']:7.2f}s | pico {st['peak_rss_mb']:6.0f} MB")
+    write_json(json_path, res)
+    console.print(f"resultado: {json_path}")
+
+@app.command("bench-masks")
+def bench_masks(seconds: float = typer.Option(60.0, help="Duração do sinal sintético"),
+                k: int = typer.Option(12, help="Número de componentes")):
+    """Micro-benchmark da reconstrução das máscaras NMF (loop vs. em lote): tempo e pico de memória."""
+    from auto.bench import bench_masks as _bench
+    r = _bench(seconds=seconds, k=k)
+    console.print(f"K={r['k']} | loop {r['loop_s']:.2f}s, pico {r['loop_peak_mb']:.0f} MB | "
+                  f"lote {r['batched_s']:.2f}s, pico {r['batched_peak_mb']:.0f} MB | dif. máx {r['max_abs_diff']:.2e}")
+
+@app.command("bench-demucs")
+def bench_demucs(path: str = typer.Argument(..., help="Áudio de entrada (de preferência longo)"),
+                 base_model: str = typer.Option("htdemucs"),
+                 jobs: List[int] = typer.Option([1, 4], "--jobs", help="Nº de processos a comparar (repetível)"),
+                 shifts: int = typer.Option(1), overlap: float = typer.Option(0.25)):
+    """Demucs em CPU: 1 job vs. segmentos em N processos (tempo e diferença máxima)."""
+    from auto.bench import bench_demucs_jobs
+    for row in bench_demucs_jobs(path, base_model, jobs=jobs, shifts=shifts, overlap=overlap):
+        console.print(f"jobs={row['jobs']:>2} | {row['seconds']:7.2f}s | dif. máx {row['max_abs_diff']:.2e}")
+
+@app.command("bench-startup")
+def bench_startup(repeat: int = typer.Option(5, help="Execuções por caso")):
+    """Tempo de partida a frio do CLI e da API (processos novos)."""
+    from auto.bench import bench_startup as _bench
+    for row in _bench(repeat=repeat):
+        console.print(f"{row['case']:>20} | mín {row['min_s']:6.2f}s | mediana {row['median_s']:6.2f}s")
+
+@app.command()
+def warmup(model: List[str] = typer.Option(["htdemucs"], "--model", help="Modelos Demucs a carregar (repetível)"),
+           gpu: bool = typer.Option(False, help="Tentar GPU"),
+           tagger: bool = typer.Option(True, help="Carregar também o PANNs"),
+           demucs_jobs: int = typer.Option(1, help="Subir também o pool de N processos do Demucs segmentado")):
+    """Pré-carrega imports, modelos Demucs e PANNs (ex.: para aquecer o cache de pesos de uma imagem)."""
+    from auto.runner import warmup as _warmup
+    for name, secs in _warmup(model, device=detect_device(gpu), tagger=tagger, demucs_jobs=demucs_jobs).items():
+        console.print(f"{name:>20} | {secs:6.2f}s")
+
 @app.command()
-def serve(host: str="127.0.0.1", port: int=8000):
+def serve(host: str="127.0.0.1", port: int=8000,
+          warmup_models: Optional[str] = typer.Option(None, "--warmup", help="Modelos a pré-carregar no startup, ex.: htdemucs,htdemucs_6s")):
     import uvicorn
+    if warmup_models:
+        os.environ["DESMIX_WARMUP"] = warmup_models
     uvicorn.run("api.main:app", host=host, port=port, reload=False)
 
 @app.command()
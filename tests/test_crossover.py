@@ -0,0 +1,43 @@
+"""Banco de crossover da bateria: bandas somam a entrada e cada uma fica com a sua faixa."""
+import numpy as np
+import pytest
+
+from auto.crossover import band_names, band_split, check_crossovers, parse_crossovers
+
+SR = 44100
+
+@pytest.mark.parametrize("channels", [None, 2])
+@pytest.mark.parametrize("n", [SR * 2 + 37, 4095, 100, 1])   # 4095 e menores: menos de um quadro
+def test_bands_sum_to_input(channels, n):
+    shape = (n,) if channels is None else (channels, n)
+    y = (0.5 * np.random.default_rng(n).standard_normal(shape)).astype(np.float32)
+    bands = band_split(y, SR, (160.0, 6000.0))
+    assert len(bands) == 3 and all(b.shape == y.shape and b.dtype == np.float32 for b in bands)
+    np.testing.assert_allclose(np.sum(bands, axis=0), y, atol=1e-5)
+
+@pytest.mark.parametrize("channels", [None, 2])
+def test_each_band_keeps_its_range(channels):
+    t = np.arange(SR * 3 + 11) / SR
+    for band, freq in enumerate((50.0, 1000.0, 12000.0)):
+        y = (0.5 * np.sin(2 * np.pi * freq * t)).astype(np.float32)
+        if channels:
+            y = np.stack([y, 0.5 * y])
+        energy = np.array([np.sum(b[..., SR // 2:-SR // 2] ** 2) for b in band_split(y, SR)])
+        assert energy[band] / energy.sum() > 0.999, (freq, energy)
+
+def test_parse_crossovers():
+    assert parse_crossovers("160,6000") == (160.0, 6000.0)
+    assert parse_crossovers(" 100; 1000 ,8000 ") == (100.0, 1000.0, 8000.0)
+    for text in ["", " , ", "abc", "160,x", "6000,160", "160,160", "0,100", "-5,100"]:
+        with pytest.raises(ValueError):
+            parse_crossovers(text)
+
+def test_check_crossovers_nyquist():
+    assert check_crossovers([160, 6000], SR) == (160.0, 6000.0)
+    with pytest.raises(ValueError):
+        check_crossovers((160.0, 22050.0), SR)
+
+def test_band_names():
+    assert band_names(2) == ["low", "high"]
+    assert band_names(3) == ["low", "mid", "high"]
+    assert band_names(4) == ["low", "mid1", "mid2", "high"]
@@ -0,0 +1,67 @@
+"""apply_segments (Demucs em segmentos num pool) contra o apply_model do próprio Demucs."""
+import random
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("demucs")
+from demucs.apply import BagOfModels, apply_model
+
+from auto import engine as E
+
+SR = 100          # amostras/s: max_shift = 50, segmento = 200 amostras
+SOURCES = ["a", "b", "c"]
+
+class TinyDemucs(torch.nn.Module):
+    """Convolução por canal (uma saída por fonte) com contexto: o resultado de cada segmento
+    depende do padding/`valid_length`, como num modelo de verdade."""
+
+    def __init__(self, seed: int):
+        super().__init__()
+        self.samplerate, self.segment, self.audio_channels = SR, 2.0, 2
+        self.sources = list(SOURCES)
+        gen = torch.Generator().manual_seed(seed)
+        self.conv = torch.nn.Conv1d(1, len(SOURCES), 9, padding=4)
+        with torch.no_grad():
+            self.conv.weight.copy_(torch.randn(self.conv.weight.shape, generator=gen))
+            self.conv.bias.copy_(torch.randn(self.conv.bias.shape, generator=gen))
+
+    def valid_length(self, length: int) -> int:
+        return length + 16
+
+    def forward(self, x):
+        B, C, L = x.shape
+        y = torch.tanh(self.conv(x.reshape(B * C, 1, L)))
+        return y.reshape(B, C, len(SOURCES), L).transpose(1, 2)
+
+@pytest.fixture
+def pool(monkeypatch):
+    """Segmentos em threads no próprio processo, com o modelo do teste no `_WORKER`."""
+    with ThreadPoolExecutor(2) as ex:
+        monkeypatch.setattr(E, "segment_pool", lambda name, jobs: ex)
+        yield lambda model: monkeypatch.setitem(
+            E._WORKER, "engine", SimpleNamespace(model=model, samplerate=SR, name="tiny"))
+
+def _bag():
+    return BagOfModels([TinyDemucs(0), TinyDemucs(1)], weights=[[1.0, 0.5, 0.0], [0.5, 1.0, 1.0]])
+
+@pytest.mark.parametrize("shifts", [1, 3])
+@pytest.mark.parametrize("overlap", [0.1, 0.25, 0.5])
+@pytest.mark.parametrize("seconds", [0.8, 7.3])   # 0.8 s: menor que um segmento
+@pytest.mark.parametrize("make_model", [_bag, lambda: TinyDemucs(2)], ids=["bag", "single"])
+def test_apply_segments_matches_apply_model(pool, make_model, seconds, overlap, shifts):
+    model = make_model().eval()
+    pool(model)
+    mix = np.random.default_rng(0).standard_normal((2, int(seconds * SR))).astype(np.float32)
+    random.seed(1234)
+    with torch.no_grad():
+        ref = apply_model(model, torch.from_numpy(mix)[None], shifts=shifts, split=True,
+                          overlap=overlap, progress=False)[0].numpy()
+    random.seed(1234)
+    out = E.apply_segments(SimpleNamespace(model=model, samplerate=SR, name="tiny"), mix,
+                           shifts=shifts, overlap=overlap, jobs=2)
+    assert out.shape == ref.shape
+    np.testing.assert_allclose(out, ref, rtol=1e-4, atol=1e-5)
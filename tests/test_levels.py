@@ -0,0 +1,47 @@
+"""analyze_levels (trim + loudness numa passada) contra trim_silence/pyloudnorm, a referência."""
+import numpy as np
+import pytest
+
+librosa = pytest.importorskip("librosa")
+pyln = pytest.importorskip("pyloudnorm")
+pytest.importorskip("scipy")
+
+from auto.bench import synthetic_stems
+from auto.post import analyze_levels, trim_and_normalize
+
+def _cases():
+    rng = np.random.default_rng(1)
+    cases = [(name, y, sr) for name, (y, sr) in synthetic_stems(44100, 12.0).items()]
+    sr = 44100
+    t = np.arange(sr * 15) / sr
+    v = (0.2 * np.sin(2 * np.pi * 300 * t) * (t > 3.3) * (t < 11.7)).astype(np.float32)
+    cases.append(("gap", np.stack([v, 0.5 * v]), sr))
+    env = np.r_[np.zeros(sr * 2), np.ones(sr * 5)].astype(np.float32)
+    cases.append(("mono", (0.05 * rng.standard_normal(sr * 7)).astype(np.float32) * env, sr))
+    cases.append(("22k", (0.1 * rng.standard_normal((2, 22050 * 9))).astype(np.float32), 22050))
+    cases.append(("odd", (0.1 * rng.standard_normal((2, 44100 * 3 + 123))).astype(np.float32), 44100))
+    return cases
+
+def _lufs(y, sr):
+    return pyln.Meter(sr).integrated_loudness((y.T if y.ndim > 1 else y).astype(np.float64))
+
+@pytest.mark.parametrize("name,y,sr", _cases(), ids=lambda v: v if isinstance(v, str) else "")
+def test_matches_reference(name, y, sr):
+    idx = librosa.effects.split(y, top_db=40.0)
+    start, end, lufs = analyze_levels(y, sr)
+    assert (start, end) == (idx[0, 0], idx[-1, 1])
+    assert abs(lufs - _lufs(y[..., start:end], sr)) < 0.003
+    assert abs(analyze_levels(y, sr, trim=False)[2] - _lufs(y, sr)) < 0.003
+
+@pytest.mark.filterwarnings("error")
+@pytest.mark.parametrize("level", [0.0, 1e-6])
+def test_silent_or_gated_stem(level):
+    y = np.full((2, 44100 * 3), level, dtype=np.float32)
+    assert analyze_levels(y, 44100)[2] == -np.inf
+    out = trim_and_normalize(y, 44100)
+    assert out.shape == y.shape and np.all(out == level)
+
+def test_shorter_than_gating_block():
+    y = (0.1 * np.random.default_rng(0).standard_normal((2, 10000))).astype(np.float32)
+    assert analyze_levels(y, 44100)[2] is None
+    np.testing.assert_array_equal(trim_and_normalize(y.copy(), 44100), y)
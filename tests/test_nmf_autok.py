@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+
+librosa = pytest.importorskip("librosa")
+pytest.importorskip("sklearn")
+
+from auto.bench import synthetic_mix
+from auto.nmf_split import auto_k_nmf
+
+def _full_sweep(mag, max_k=6, random_state=0):
+    """Busca original: ajusta todos os k de 1 a max_k e escolhe o joelho depois."""
+    from sklearn.decomposition import NMF
+    errs, Ws, Hs = [], [], []
+    for k in range(1, max_k + 1):
+        nmf = NMF(n_components=k, init="nndsvda", max_iter=400, random_state=random_state)
+        W = nmf.fit_transform(mag)
+        H = nmf.components_
+        errs.append(np.linalg.norm(mag - W @ H) / (mag.size**0.5))
+        Ws.append(W); Hs.append(H)
+    best_k = max_k
+    for i in range(1, len(errs)):
+        if (errs[i - 1] - errs[i]) / max(errs[i - 1], 1e-6) < 0.05:
+            best_k = i
+            break
+    return Ws[best_k - 1], Hs[best_k - 1], best_k, errs
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_linear_search_matches_full_sweep(seed):
+    mix, _ = synthetic_mix(sr=22050, seconds=8.0, seed=seed)
+    mag = np.abs(librosa.stft(mix, n_fft=2048, hop_length=512))
+    W0, H0, k0, errs0 = _full_sweep(mag)
+    W, H, k, errs = auto_k_nmf(mag, strategy="linear")
+    assert k == k0
+    np.testing.assert_allclose(W, W0, rtol=1e-5, atol=1e-6)
+    np.testing.assert_allclose(H, H0, rtol=1e-5, atol=1e-6)
+    np.testing.assert_allclose(errs, errs0[:len(errs)], rtol=1e-6)